@@ -0,0 +1,345 @@
+import os
+import typing
+import asyncio
+import difflib
+import logging
+import sqlite3
+
+import utils
+import modrinth
+import curseforge
+
+
+CATALOG_LOCATION = "config/catalog.sqlite3"
+MODRINTH_PAGE_SIZE = 100
+CURSEFORGE_PAGE_SIZE = 50
+CURSEFORGE_MAX_INDEX = 10000  # The CurseForge API does not return results past this
+PARALLEL_PAGES = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY,
+    provider TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    summary TEXT,
+    downloads INTEGER,
+    icon_url TEXT,
+    updated TEXT,
+    UNIQUE (provider, slug)
+);
+CREATE INDEX IF NOT EXISTS projects_slug ON projects (slug);
+CREATE INDEX IF NOT EXISTS projects_project_id ON projects (provider, project_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS projects_fts USING fts5(
+    slug, name, content='projects', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS projects_ai AFTER INSERT ON projects BEGIN
+    INSERT INTO projects_fts (rowid, slug, name) VALUES (new.id, new.slug, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS projects_ad AFTER DELETE ON projects BEGIN
+    INSERT INTO projects_fts (projects_fts, rowid, slug, name) VALUES ('delete', old.id, old.slug, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS projects_au AFTER UPDATE ON projects BEGIN
+    INSERT INTO projects_fts (projects_fts, rowid, slug, name) VALUES ('delete', old.id, old.slug, old.name);
+    INSERT INTO projects_fts (rowid, slug, name) VALUES (new.id, new.slug, new.name);
+END;
+"""
+
+COLUMNS = ('provider', 'slug', 'project_id', 'name', 'summary', 'downloads', 'icon_url', 'updated')
+
+
+def _fts_query(terms: typing.Iterable[str]):
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def _trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class Catalog:
+    """
+    Local index of mod projects for lookups, autocompletion and fuzzy matching without network. \n
+    Built incrementally from the search results of both providers with update. \n
+    """
+
+    def __init__(self, location: str = CATALOG_LOCATION):
+        directory = os.path.dirname(location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.location = location
+        self._db = sqlite3.connect(location)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+        try:
+            self._db.executescript(FTS_SCHEMA)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite without FTS5 or the trigram tokenizer (< 3.34), fall back to LIKE queries
+            logging.warning("SQLite has no FTS5 trigram support, catalog searches will be slower")
+            self.has_fts = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+
+    def _get_meta(self, key: str):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: typing.Optional[str]):
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def add(self, projects: typing.Iterable[dict]):
+        """
+        Inserts or updates projects, dicts with the keys in COLUMNS. \n
+        A project that was renamed replaces the entry with its old slug. \n
+        """
+
+        with self._db:
+            for project in projects:
+                self._db.execute(
+                    "DELETE FROM projects WHERE provider = ? AND project_id = ? AND slug != ?",
+                    (project['provider'], project['project_id'], project['slug'])
+                )
+                self._db.execute(
+                    f"INSERT INTO projects ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                    f"ON CONFLICT (provider, slug) DO UPDATE SET "
+                    f"{', '.join(f'{column} = excluded.{column}' for column in COLUMNS[2:])}",
+                    tuple(project.get(column) for column in COLUMNS)
+                )
+
+    def get(self, provider: str, slug: str):
+        """
+        Returns the project with this exact slug, or None. \n
+        """
+
+        row = self._db.execute(
+            "SELECT * FROM projects WHERE provider = ? AND slug = ?", (provider, slug)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def complete(self, prefix: str, provider: str = None, limit: int = 10):
+        """
+        Returns the most downloaded projects of which the slug starts with prefix. \n
+        """
+
+        prefix = prefix.lower()
+        query = "SELECT * FROM projects WHERE slug >= ? AND slug < ?"
+        params = [prefix, prefix + '\uffff']
+        if provider:
+            query += " AND provider = ?"
+            params.append(provider)
+        query += " ORDER BY downloads DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._db.execute(query, params)]
+
+    def search(self, text: str, provider: str = None, limit: int = 10):
+        """
+        Returns projects of which the slug or name contains text, best matches first. \n
+        """
+
+        if not self.has_fts or len(text) < 3:
+            query = "SELECT * FROM projects WHERE (slug LIKE ? OR name LIKE ?)"
+            params = [f"%{text}%", f"%{text}%"]
+            order = " ORDER BY downloads DESC LIMIT ?"
+        else:
+            query = ("SELECT projects.* FROM projects_fts JOIN projects ON projects.id = projects_fts.rowid "
+                     "WHERE projects_fts MATCH ?")
+            params = [_fts_query([text])]
+            order = " ORDER BY projects_fts.rank, downloads DESC LIMIT ?"
+
+        if provider:
+            query += " AND provider = ?"
+            params.append(provider)
+        params.append(limit)
+        return [dict(row) for row in self._db.execute(query + order, params)]
+
+    def suggest(self, slug: str, provider: str = None, limit: int = 5, cutoff: float = 0.6):
+        """
+        Returns the projects with slugs most similar to slug, for correcting typos. \n
+        Candidates share trigrams with slug and are ranked by similarity. \n
+        """
+
+        slug = slug.lower()
+        trigrams = _trigrams(slug)
+        if self.has_fts and trigrams:
+            query = ("SELECT projects.* FROM projects_fts JOIN projects ON projects.id = projects_fts.rowid "
+                     "WHERE projects_fts MATCH ?")
+            params = [f"slug : ({_fts_query(trigrams)})"]
+        else:
+            query = "SELECT * FROM projects WHERE slug LIKE ?"
+            params = [f"{slug[:1]}%"]
+
+        if provider:
+            query += " AND provider = ?"
+            params.append(provider)
+        query += " ORDER BY rank LIMIT 200" if self.has_fts and trigrams else " LIMIT 2000"
+
+        scored = []
+        for row in self._db.execute(query, params):
+            score = difflib.SequenceMatcher(None, slug, row['slug']).ratio()
+            if score >= cutoff:
+                scored.append((score, row['downloads'] or 0, dict(row)))
+        scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        return [project for _, _, project in scored[:limit]]
+
+    def suggest_url(self, url: str):
+        """
+        Returns the URL of the most similar project for a mod URL that was not found, or None. \n
+        """
+
+        provider = utils.get_provider_from_url(url)
+        if provider is None:
+            return None
+
+        suggestions = self.suggest(utils.get_slug_from_url(url), provider=provider, limit=1)
+        if not suggestions:
+            return None
+        return utils.get_mod_url(provider, suggestions[0]['slug'])
+
+    def _progress(self, provider: str):
+        """
+        Returns the checkpoint (date of the newest project of the last finished update), the offset to continue
+        an update that stopped at max_pages at and the newest date that update has seen. \n
+        """
+
+        offset = self._get_meta(f'{provider}_resume_offset')
+        checkpoint = self._get_meta(f'{provider}_updated')
+        return checkpoint, int(offset or 0), self._get_meta(f'{provider}_resume_newest') or checkpoint
+
+    def _save_progress(self, provider: str, finished: bool, offset: int, newest: typing.Optional[str]):
+        """
+        Moves the checkpoint once an update reached the end of the results or the previous checkpoint.
+        An update that stopped before keeps the checkpoint and stores where to continue, projects past
+        that offset are older than the newest one seen, so they would never be fetched otherwise. \n
+        """
+
+        with self._db:
+            if finished:
+                self._set_meta(f'{provider}_updated', newest)
+            self._set_meta(f'{provider}_resume_offset', None if finished else str(offset))
+            self._set_meta(f'{provider}_resume_newest', None if finished else newest)
+
+    async def _update_modrinth(self, max_pages: int):
+        last_update, offset, newest = self._progress('modrinth')
+        finished = False
+        for _ in range(0, max_pages, PARALLEL_PAGES):
+            pages = await asyncio.gather(*(
+                modrinth.search_mods_async(offset=offset + i * MODRINTH_PAGE_SIZE, limit=MODRINTH_PAGE_SIZE)
+                for i in range(PARALLEL_PAGES)
+            ))
+            offset += PARALLEL_PAGES * MODRINTH_PAGE_SIZE
+
+            hits = [hit for page in pages if page for hit in page['hits']]
+            projects = [{
+                'provider': 'modrinth',
+                'slug': hit['slug'],
+                'project_id': hit['project_id'],
+                'name': hit['title'],
+                'summary': hit.get('description'),
+                'downloads': hit.get('downloads'),
+                'icon_url': hit.get('icon_url'),
+                'updated': hit.get('date_modified')
+            } for hit in hits if last_update is None or hit.get('date_modified', '') > last_update]
+            self.add(projects)
+            if projects:
+                newest = max(newest or '', max(project['updated'] or '' for project in projects))
+
+            # Projects on a failed page would be older than the new checkpoint and never fetched,
+            # so the checkpoint only moves on once an update got every page
+            if any(page is None for page in pages):
+                logging.warning("Could not fetch all Modrinth projects, the next update fetches them again")
+                return
+            # Stop at the end of the results or at projects that are already up to date
+            if len(projects) < len(hits) or any(not page['hits'] for page in pages):
+                finished = True
+                break
+
+        self._save_progress('modrinth', finished, offset, newest)
+
+    async def _update_curseforge(self, max_pages: int):
+        last_update, index, newest = self._progress('curseforge')
+        finished = False
+        for _ in range(0, max_pages, PARALLEL_PAGES):
+            indexes = [
+                index + i * CURSEFORGE_PAGE_SIZE for i in range(PARALLEL_PAGES)
+                if index + (i + 1) * CURSEFORGE_PAGE_SIZE <= CURSEFORGE_MAX_INDEX
+            ]
+            if not indexes:
+                # Older projects can't be reached through the search
+                finished = True
+                break
+
+            pages = await asyncio.gather(*(
+                curseforge.search_mods_async(index=i, page_size=CURSEFORGE_PAGE_SIZE) for i in indexes
+            ))
+            index += PARALLEL_PAGES * CURSEFORGE_PAGE_SIZE
+
+            mods = [mod for page in pages if page for mod in page['data']]
+            projects = [{
+                'provider': 'curseforge',
+                'slug': mod['slug'],
+                'project_id': str(mod['id']),
+                'name': mod['name'],
+                'summary': mod.get('summary'),
+                'downloads': int(mod.get('downloadCount') or 0),
+                'icon_url': (mod.get('logo') or {}).get('thumbnailUrl'),
+                'updated': mod.get('dateModified')
+            } for mod in mods if last_update is None or mod.get('dateModified', '') > last_update]
+            self.add(projects)
+            if projects:
+                newest = max(newest or '', max(project['updated'] or '' for project in projects))
+
+            if any(page is None for page in pages):
+                logging.warning("Could not fetch all CurseForge projects, the next update fetches them again")
+                return
+            if len(projects) < len(mods) or any(not page['data'] for page in pages):
+                finished = True
+                break
+
+        self._save_progress('curseforge', finished, index, newest)
+
+    def update(self, max_pages: int = 200):
+        """
+        Adds projects that were created or updated since the last update, newest first. \n
+        Every update fetches at most max_pages pages per provider, the next update continues where one
+        that stopped there left off. \n
+        """
+
+        async def run():
+            await self._update_modrinth(max_pages)
+            if curseforge.has_api_access():
+                await self._update_curseforge(max_pages)
+            else:
+                logging.warning("Not updating CurseForge projects because API key is not set")
+
+        before = len(self)
+        asyncio.run(run())
+        logging.info(f"Catalog has {len(self)} projects, {len(self) - before} new")
+
+
+def open_catalog(location: str = CATALOG_LOCATION):
+    """
+    Returns the catalog if it was built before, otherwise None. \n
+    """
+
+    if not os.path.exists(location):
+        return None
+    return Catalog(location)
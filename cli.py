@@ -0,0 +1,465 @@
+import os
+import sys
+import json
+import typing
+import logging
+import argparse
+import multiprocessing
+from dotenv import load_dotenv
+
+import hedge
+import proxy
+import utils
+import pack
+import matrix
+import results
+import catalog
+import install
+import modpack
+import downloads
+import watch
+import pipeline
+import providers
+import snapshot
+import profiling
+import curseforge
+
+
+ENV_LOCATION = "config/.env"
+
+
+def load_env():
+    if os.path.exists(ENV_LOCATION):
+        load_dotenv(dotenv_path=ENV_LOCATION)
+    api_key = os.getenv("CURSEFORGE_API_KEY")
+    if api_key:
+        curseforge.set_api_key(api_key)
+
+
+def print_result(url: str, entry: dict):
+    if entry['status'] == 'ok':
+        print(f"{url}  {entry['file_name']}", flush=True)
+    else:
+        print(f"{url}  FAILED ({entry['status']}): {entry['error']}", flush=True)
+
+
+def print_results(store: results.ResultStore, urls: typing.Iterable[str]):
+    for url in urls:
+        print_result(url, store.entries[url])
+
+
+def search(args):
+    # Streamed, so results are printed while the rest of the list is still being read
+    urls = utils.read_urls(args.urls_file)
+    store = results.ResultStore(args.results)
+    store.reset(args.version, args.loader.lower())
+
+    def record(result: pipeline.Result):
+        store.record(result)
+        print_result(result.url, store.entries[result.url])
+
+    kwargs = {'on_result': record, 'keep_results': False, 'fallback': args.fallback, 'preference': args.prefer}
+    failed_downloads = {}
+    if not args.download:
+        pipeline.resolve(urls, store.game_version, store.mod_loader, **kwargs)
+    elif args.staged:
+        staged = install.StagedInstall(args.download)
+        pool = staged.download_pool()
+        try:
+            pipeline.resolve_and_download(urls, store.game_version, store.mod_loader, pool, **kwargs)
+            staged.join_downloads(pool)
+            staged.commit(backup=args.backup)
+        except (install.InstallError, OSError):
+            pool.close()
+            staged.abort()
+            raise
+    else:
+        pool = downloads.DownloadPool(args.download)
+        pipeline.resolve_and_download(urls, store.game_version, store.mod_loader, pool, **kwargs)
+        failed_downloads = pool.join()
+    store.save()
+    return 1 if store.failed() or failed_downloads else 0
+
+
+def retry_failed(args):
+    store = results.ResultStore(args.results)
+    if not store.entries:
+        logging.error(f"There are no results in '{args.results}', run the search command first")
+        return 1
+
+    retried = results.retry_failed(store, reasons=args.only, fallback=args.fallback, preference=args.prefer)
+    print_results(store, [result.url for result in retried])
+    logging.info(f"{sum(result.ok for result in retried)} of {len(retried)} failed mods were resolved, "
+                 f"{len(store.succeeded())} of {len(store.entries)} mods are resolved in total")
+    return 1 if store.failed() else 0
+
+
+def snapshot_export(args):
+    urls = utils.get_urls_from_file(args.urls_file)
+    failed = snapshot.export_snapshot(
+        urls=urls,
+        game_version=args.version,
+        mod_loader=args.loader.lower(),
+        path=args.output,
+        include_jars=args.include_jars
+    )
+    for url in failed:
+        logging.error(f"Couldn't export '{url}'")
+    return 1 if failed else 0
+
+
+def snapshot_install(args):
+    with snapshot.Snapshot(args.snapshot) as snap:
+        if args.urls_file:
+            urls = utils.get_urls_from_file(args.urls_file)
+            entries = [snap.get(url) for url in urls]
+            missing = [url for url, entry in zip(urls, entries) if entry is None]
+            for url in missing:
+                logging.error(f"'{url}' is not in the snapshot")
+            entries = [entry for entry in entries if entry is not None]
+        else:
+            missing = []
+            entries = snap.mods
+
+        if args.staged:
+            staged = install.StagedInstall(args.mods_folder)
+            try:
+                for entry in entries:
+                    logging.info(f"Staging '{entry['file_name']}'")
+                    staged.add(snap.install(entry, staged.staging_folder), entry['sha1'])
+                staged.commit(backup=args.backup)
+            except (install.InstallError, snapshot.SnapshotError) as e:
+                staged.abort()
+                logging.error(e)
+                return 1
+            except OSError:
+                staged.abort()
+                raise
+        else:
+            try:
+                for entry in entries:
+                    logging.info(f"Installing '{entry['file_name']}'")
+                    snap.install(entry, args.mods_folder)
+            except snapshot.SnapshotError as e:
+                logging.error(e)
+                return 1
+
+    return 1 if missing else 0
+
+
+def serve(args):
+    cache = proxy.ProxyCache(location=args.cache, api_ttl=args.api_ttl, api_key=curseforge.get_api_key() or None)
+    proxy.serve(host=args.host, port=args.port, cache=cache)
+    return 0
+
+
+def compatibility_matrix(args):
+    urls = utils.get_urls_from_file(args.urls_file)
+    combinations = [(version, loader.lower()) for version in args.versions for loader in args.loaders]
+    rows = matrix.build_matrix(urls, combinations)
+    print(matrix.format_table(rows, combinations))
+    if args.csv:
+        matrix.write_csv(rows, combinations, args.csv)
+    return 0
+
+
+def hash_mods(args):
+    cache = utils.HashCache(location=None if args.no_cache else utils.HASH_CACHE_LOCATION)
+    hashes = utils.hash_folder(args.mods_folder, algorithms=args.algorithms, cache=cache)
+    print(json.dumps(hashes, indent=4, sort_keys=True))
+    return 0
+
+
+def catalog_command(args):
+    with catalog.Catalog(args.catalog) as mod_catalog:
+        if args.action == 'update':
+            mod_catalog.update(max_pages=args.max_pages)
+            return 0
+
+        if args.action == 'complete':
+            projects = mod_catalog.complete(args.text, provider=args.provider)
+        elif args.action == 'suggest':
+            projects = mod_catalog.suggest(args.text, provider=args.provider)
+        else:
+            projects = mod_catalog.search(args.text, provider=args.provider)
+
+        for project in projects:
+            print(f"{utils.get_mod_url(project['provider'], project['slug'])}  {project['name']}")
+    return 0
+
+
+def import_pack(args):
+    pack = modpack.import_modpack(args.modpack, side=args.side)
+    logging.info(f"'{pack.name}' is made for {pack.game_version} ({pack.mod_loader})")
+
+    if args.urls_out:
+        with open(args.urls_out, 'w') as f:
+            f.writelines(f"{utils.get_mod_url(entry['provider'], entry['slug'])}\n"
+                         for entry in pack.mods if entry['project_id'] is not None)
+
+    if args.mods_folder and args.staged:
+        staged = install.StagedInstall(args.mods_folder)
+        try:
+            staged.download_all(
+                downloads.Download(entry['file_url'], entry['file_name'], sha1=entry['sha1']) for entry in pack.mods
+            )
+            staged.commit(backup=args.backup)
+        except (install.InstallError, OSError):
+            staged.abort()
+            raise
+    elif args.mods_folder:
+        files = [downloads.Download(entry['file_url'], entry['file_name'], sha1=entry['sha1']) for entry in pack.mods]
+        failed = downloads.download_all(files, args.mods_folder)
+        pack.failed.extend(download.url for download in failed)
+
+    for failed in pack.failed:
+        logging.error(f"Couldn't resolve '{failed}'")
+    return 1 if pack.failed else 0
+
+
+def pack_build(args):
+    store = results.ResultStore(args.results)
+    try:
+        pack.build_pack(
+            args.mods_folder, args.output, config_folder=args.config, base=args.base,
+            game_version=store.game_version, mod_loader=store.mod_loader,
+            mods=pack.mod_entries(store.succeeded().values(), args.mods_folder), workers=args.workers
+        )
+    except pack.PackError as e:
+        logging.error(e)
+        return 1
+    return 0
+
+
+def pack_apply(args):
+    try:
+        pack.apply_pack(args.pack, args.directory, backup=args.backup)
+    except (pack.PackError, install.InstallError) as e:
+        logging.error(e)
+        return 1
+    return 0
+
+
+def rollback(args):
+    try:
+        install.rollback(args.mods_folder)
+    except install.InstallError as e:
+        logging.error(e)
+        return 1
+    return 0
+
+
+def profile_command(args):
+    if args.action == 'save':
+        if not (args.name and args.urls_file and args.version):
+            logging.error("Saving a profile needs a name, --urls-file and --version")
+            return 1
+        watch.save_profile(args.name, {
+            'urls_file': os.path.abspath(args.urls_file),
+            'game_version': args.version,
+            'mod_loader': args.loader.lower(),
+            'mods_folder': os.path.abspath(args.mods_folder) if args.mods_folder else None,
+            'interval': args.interval,
+            'auto_stage': args.auto_stage
+        })
+    elif args.action == 'remove':
+        if not watch.remove_profile(args.name):
+            logging.error(f"There is no profile named '{args.name}'")
+            return 1
+    else:
+        for name, profile in watch.load_profiles().items():
+            print(f"{name}: {profile['game_version']} {profile['mod_loader']}, '{profile['urls_file']}', "
+                  f"every {profile.get('interval', watch.DEFAULT_INTERVAL)}s")
+    return 0
+
+
+def watch_command(args):
+    try:
+        watch.watch(args.profiles, once=args.once, feed_location=args.feed)
+    except KeyError as e:
+        logging.error(e.args[0])
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def add_staged_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--staged', action='store_true',
+                        help="download and verify all mods next to the mods folder, then swap it in with renames")
+    parser.add_argument('--backup', action='store_true',
+                        help="with --staged, keep the mods folder of the install before as a dated backup")
+
+
+def add_fallback_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--fallback', action='store_true',
+                        help="look for every mod on all providers at once and use another one if needed")
+    parser.add_argument('--prefer', nargs='+', metavar='PROVIDER', choices=list(providers.PROVIDERS),
+                        help="with --fallback, providers in order of preference, e.g. modrinth curseforge")
+
+
+def rate(text: str):
+    try:
+        return downloads.parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="Update minecraft mods in bulk without the GUI.")
+    parser.add_argument('--proxy', help="URL of a caching proxy started with the serve command")
+    parser.add_argument('--no-hedge', action='store_true', help="don't send a second copy of slow API requests")
+    parser.add_argument('--limit-rate', type=rate,
+                        help="limit all downloads together, e.g. 500k or 2M bytes per second")
+    parser.add_argument('--profile', nargs='?', const=profiling.PROFILE_LOCATION, metavar='DIR',
+                        help="profile the command and write pstats, collapsed stacks and tracemalloc snapshots to DIR")
+    parser.add_argument('--limit-rate-file', help="read the download limit from this file whenever it changes")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    search_parser = subparsers.add_parser('search', help="resolve mods online and keep the results for retry-failed")
+    search_parser.add_argument('urls_file', help="file with one mod URL per line, - to read them from stdin")
+    search_parser.add_argument('-v', '--version', required=True, help="minecraft version, e.g. 1.19.2")
+    search_parser.add_argument('-l', '--loader', default='fabric', help="mod loader, e.g. fabric, forge or any")
+    search_parser.add_argument('--results', default=results.RESULTS_LOCATION, help="results file")
+    search_parser.add_argument('--download', metavar='MODS_FOLDER',
+                               help="without confirming, download every mod into the folder as soon as it resolves")
+    add_staged_arguments(search_parser)
+    add_fallback_arguments(search_parser)
+    search_parser.set_defaults(func=search)
+
+    retry_parser = subparsers.add_parser('retry-failed', help="resolve only the mods that failed in the last search")
+    retry_parser.add_argument('--only', nargs='+', metavar='REASON',
+                              choices=[pipeline.NO_API_KEY, pipeline.NOT_FOUND, pipeline.NO_COMPATIBLE_FILE,
+                                       pipeline.RATE_LIMITED, pipeline.TIMEOUT, pipeline.ERROR],
+                              help="only retry mods that failed for these reasons, e.g. timeout rate_limited")
+    retry_parser.add_argument('--results', default=results.RESULTS_LOCATION, help="results file")
+    add_fallback_arguments(retry_parser)
+    retry_parser.set_defaults(func=retry_failed)
+
+    export_parser = subparsers.add_parser('snapshot-export', help="resolve mods online and write an offline snapshot")
+    export_parser.add_argument('urls_file', help="file with one mod URL per line")
+    export_parser.add_argument('-v', '--version', required=True, help="minecraft version, e.g. 1.19.2")
+    export_parser.add_argument('-l', '--loader', default='fabric', help="mod loader, e.g. fabric, forge or any")
+    export_parser.add_argument('-o', '--output', required=True, help="snapshot file to write")
+    export_parser.add_argument('--include-jars', action='store_true', help="also store the mod jars")
+    export_parser.set_defaults(func=snapshot_export)
+
+    install_parser = subparsers.add_parser('snapshot-install', help="install mods from a snapshot without network")
+    install_parser.add_argument('snapshot', help="snapshot file")
+    install_parser.add_argument('mods_folder', help="folder to install the mods in")
+    install_parser.add_argument('--urls-file', help="only install the mods in this file")
+    add_staged_arguments(install_parser)
+    install_parser.set_defaults(func=snapshot_install)
+
+    serve_parser = subparsers.add_parser('serve', help="run a caching proxy for other updaters on the LAN")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="address to listen on, 0.0.0.0 for all")
+    serve_parser.add_argument('--port', type=int, default=8642)
+    serve_parser.add_argument('--cache', default=proxy.CACHE_LOCATION, help="cache folder")
+    serve_parser.add_argument('--api-ttl', type=float, default=proxy.API_TTL, help="seconds to cache API responses")
+    serve_parser.set_defaults(func=serve)
+
+    matrix_parser = subparsers.add_parser('matrix', help="show which mods are available for several versions")
+    matrix_parser.add_argument('urls_file', help="file with one mod URL per line")
+    matrix_parser.add_argument('-v', '--versions', nargs='+', required=True, help="minecraft versions to check")
+    matrix_parser.add_argument('-l', '--loaders', nargs='+', default=['fabric'], help="mod loaders to check")
+    matrix_parser.add_argument('--csv', help="also write the matrix to this csv file")
+    matrix_parser.set_defaults(func=compatibility_matrix)
+
+    hash_parser = subparsers.add_parser('hash', help="hash all jars in a mods folder")
+    hash_parser.add_argument('mods_folder')
+    hash_parser.add_argument('-a', '--algorithms', nargs='+', default=list(utils.HASH_ALGORITHMS),
+                             help="hashlib algorithms and/or murmur2 (CurseForge fingerprint)")
+    hash_parser.add_argument('--no-cache', action='store_true', help="hash every file again")
+    hash_parser.set_defaults(func=hash_mods)
+
+    catalog_parser = subparsers.add_parser('catalog', help="local mod catalog for lookups without network")
+    catalog_parser.add_argument('action', choices=['update', 'search', 'complete', 'suggest'])
+    catalog_parser.add_argument('text', nargs='?', default='', help="text to search, complete or correct")
+    catalog_parser.add_argument('-p', '--provider', choices=['curseforge', 'modrinth'])
+    catalog_parser.add_argument('--max-pages', type=int, default=200, help="pages to fetch per provider and update")
+    catalog_parser.add_argument('--catalog', default=catalog.CATALOG_LOCATION, help="catalog file")
+    catalog_parser.set_defaults(func=catalog_command)
+
+    pack_parser = subparsers.add_parser('import-pack', help="import the mods of a .mrpack or CurseForge modpack")
+    pack_parser.add_argument('modpack', help=".mrpack, CurseForge modpack zip or manifest.json")
+    pack_parser.add_argument('mods_folder', nargs='?', help="download the mods of the pack to this folder")
+    pack_parser.add_argument('--side', choices=['server', 'client'], help="leave out mods that don't support this side")
+    pack_parser.add_argument('--urls-out', help="write the mod URLs to this file")
+    add_staged_arguments(pack_parser)
+    pack_parser.set_defaults(func=import_pack)
+
+    rollback_parser = subparsers.add_parser('rollback', help="swap back the mods folder replaced by a staged install")
+    rollback_parser.add_argument('mods_folder')
+    rollback_parser.set_defaults(func=rollback)
+
+    pack_build_parser = subparsers.add_parser('pack-build', help="write a server pack of a mods folder and configs")
+    pack_build_parser.add_argument('mods_folder')
+    pack_build_parser.add_argument('output', help="pack file, .zip or .tar.zst")
+    pack_build_parser.add_argument('--config', metavar='FOLDER', help="config folder to include")
+    pack_build_parser.add_argument('--base', metavar='PACK',
+                                   help="previous pack, only files that changed since are stored (delta pack)")
+    pack_build_parser.add_argument('--results', default=results.RESULTS_LOCATION,
+                                   help="results file with the mod metadata for the lockfile")
+    pack_build_parser.add_argument('-w', '--workers', type=int, default=pack.WORKERS,
+                                   help="threads for hashing and compression")
+    pack_build_parser.set_defaults(func=pack_build)
+
+    pack_apply_parser = subparsers.add_parser('pack-apply', help="install a server pack or delta pack")
+    pack_apply_parser.add_argument('pack')
+    pack_apply_parser.add_argument('directory', help="server folder with the mods and config folders")
+    pack_apply_parser.add_argument('--backup', action='store_true',
+                                   help="keep the mods folder of the install before as a dated backup")
+    pack_apply_parser.set_defaults(func=pack_apply)
+
+    profile_parser = subparsers.add_parser('profile', help="save the mod lists that the watch command polls")
+    profile_parser.add_argument('action', choices=['save', 'remove', 'list'])
+    profile_parser.add_argument('name', nargs='?')
+    profile_parser.add_argument('--urls-file', help="file with one mod URL per line")
+    profile_parser.add_argument('-v', '--version', help="minecraft version, e.g. 1.19.2")
+    profile_parser.add_argument('-l', '--loader', default='fabric', help="mod loader, e.g. fabric, forge or any")
+    profile_parser.add_argument('--mods-folder', help="mods folder of the server")
+    profile_parser.add_argument('--interval', type=int, default=watch.DEFAULT_INTERVAL, help="seconds between polls")
+    profile_parser.add_argument('--auto-stage', action='store_true',
+                                help="install updates in the mods folder with a staged install")
+    profile_parser.set_defaults(func=profile_command)
+
+    watch_parser = subparsers.add_parser('watch', help="poll saved profiles for updates and write a change feed")
+    watch_parser.add_argument('profiles', nargs='*', help="profiles to watch, all if left out")
+    watch_parser.add_argument('--feed', default=watch.FEED_LOCATION, help="JSON lines file for changes, - for stdout")
+    watch_parser.add_argument('--once', action='store_true', help="poll every profile once and exit")
+    watch_parser.set_defaults(func=watch_command)
+
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        style="{", datefmt="%H:%M:%S",
+        format="[{asctime:s}.{msecs:0>3.0f} - {levelname: >8s}]: {message:s}",
+        stream=sys.stdout
+    )
+    args = make_parser().parse_args(argv)
+    load_env()
+    if args.proxy:
+        proxy.use_proxy(args.proxy)
+    hedge.set_enabled(not args.no_hedge)
+    if args.limit_rate:
+        downloads.set_bandwidth_limit(args.limit_rate)
+    if args.limit_rate_file:
+        downloads.limiter.follow(args.limit_rate_file)
+    if not args.profile:
+        return args.func(args)
+
+    profiling.set_enabled(True, args.profile)
+    # All arguments are kept with the profile, so runs with different settings can be told apart
+    labels = {name: value for name, value in vars(args).items() if name != 'func'}
+    if getattr(args, 'urls_file', None) and args.urls_file != '-':
+        labels['mods'] = len(utils.get_urls_from_file(args.urls_file))
+    with profiling.phase(args.command, labels):
+        return args.func(args)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
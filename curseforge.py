@@ -1,8 +1,12 @@
 import json
 import typing
-import httpx
+import asyncio
 import requests
 
+import net
+import utils
+import models
+
 
 class ModNotFoundException(Exception):
     """
@@ -46,12 +50,29 @@ API_URL = f'{API_BASE}/{API_VERSION}'
 GAME_ID = 432  # Minecraft
 CATEGORY_ID = 6  # Mods
 
+# Mod loader names as used by Modrinth, mapped to CurseForge modLoaderType
+MOD_LOADER_TYPES = {
+    'any': 0,
+    'forge': 1,
+    'cauldron': 2,
+    'liteloader': 3,
+    'fabric': 4,
+    'quilt': 5
+}
+
+
+# Files per page when the API can filter on the exact game version, most mods only need the first one
+FILTERED_PAGE_SIZE = 5
 
 headers = {
     'Accept': 'application/json',
     'x-api-key': ''
 }
 
+# Game version, e.g. '1.20.1' -> gameVersionTypeId of its Minecraft version group, fetched once per process
+game_version_types: typing.Optional[typing.Dict[str, int]] = None
+_game_version_types_task: typing.Optional[asyncio.Task] = None
+
 
 def set_api_key(key: str):
     global headers
@@ -62,6 +83,49 @@ def get_api_key():
     return headers['x-api-key']
 
 
+def set_api_url(url: str):
+    """
+    Overrides the API URL, e.g. to use a caching proxy. \n
+    """
+
+    global API_URL
+    API_URL = url.rstrip('/')
+
+
+def has_api_access():
+    """
+    Returns True if an API key is set or a proxy, which adds its own key, is used. \n
+    """
+
+    return bool(get_api_key()) or not API_URL.startswith(API_BASE)
+
+
+def select_file(
+        files: typing.Iterable[models.Version], game_version: str,
+        mod_loader: str = None, filtered: bool = True):
+    """
+    Returns the first (latest) file that matches the game version and mod loader. \n
+    Returns None if no file matches. \n
+    Set filtered to False if the files were not filtered on game version and mod loader by the API,
+    mod_loader is the name of the mod loader, e.g. 'fabric', None or 'any' matches all. \n
+    """
+
+    major_game_version = '.'.join(game_version.split('.')[:2])
+    for file in files:
+        game_versions = file.game_versions
+        has_snapshot = f"{major_game_version}-Snapshot" in game_versions
+        has_correct_version = game_version in game_versions
+        has_download_file = file.file.url is not None
+        if not filtered:
+            if not has_correct_version:
+                continue
+            if mod_loader not in (None, 'any') and mod_loader not in file.loaders:
+                continue
+        if ((not has_snapshot) or (has_snapshot and has_correct_version)) and has_download_file:
+            return file
+    return None
+
+
 def get_mod_from_slug(slug: str):
     """
     Returns the mod given by the slug.
@@ -79,11 +143,12 @@ def get_mod_from_slug(slug: str):
 
     while True:
         try:
-            return requests.get(
+            response = requests.get(
                 url,
                 params=params,
                 headers=headers
-            ).json()['data'][0]
+            )
+            return models.Project.from_curseforge(utils.json_loads(response.content)['data'][0])
         except IndexError:
             raise ModNotFoundException(slug)
         except json.decoder.JSONDecodeError:
@@ -106,43 +171,25 @@ async def get_mod_from_slug_async(
     Functions are called before and after making a http request. \n
     """
 
-    timeout = httpx.Timeout(30)
-    attempt = 0
     url = f"{API_URL}/mods/search"
     params = {
         'gameId': GAME_ID,
         'classId': CATEGORY_ID,
         'slug': slug
     }
-    async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
-        while True:
-            if attempt >= 3:
-                print(f"Error: Max attempts made for '{slug}'")
-                return
+    response = await net.get(url, f"'{slug}'", before_response_funcs, params=params, headers=headers)
+    if response is None:
+        return
 
-            try:
-                if before_response_funcs is not None:
-                    request_object = client.build_request(method="GET", url=url, headers=headers, params=params)
-                    for before_response_func in before_response_funcs:
-                        await before_response_func(request_object)
+    # Decode once and only keep the first result
+    mod = None
+    if response.status_code == 200:
+        data = utils.json_loads(response.content)['data']
+        if data:
+            mod = models.Project.from_curseforge(data[0])
 
-                response = await client.get(url, params=params)
-
-                mod = None
-                if response.json()['data']:
-                    mod = response.json()['data'][0]
-
-                if after_response_funcs is not None:
-                    for response_func in after_response_funcs:
-                        await response_func(response, mod)
-
-                return mod
-            except httpx.ReadTimeout:
-                attempt += 1
-                print(f"Error: httpx.ReadTimeout for '{slug}', trying again ({attempt})")
-            except httpx.ConnectTimeout:
-                attempt += 1
-                print(f"Error: httpx.ConnectTimeout for '{slug}', trying again ({attempt})")
+    await net.call_after_response_funcs(after_response_funcs, response, mod)
+    return mod
 
 
 def get_latest_mod_file(mod_id, game_version: str, mod_loader_type: int = 0, page_size: int = 200):
@@ -172,19 +219,15 @@ def get_latest_mod_file(mod_id, game_version: str, mod_loader_type: int = 0, pag
 
     while True:
         try:
-            files = requests.get(
+            files = utils.json_loads(requests.get(
                 url,
                 params=params,
                 headers=headers
-            ).json()['data']
+            ).content)['data']
 
-            for file in files:
-                major_game_version = f"{game_version.split('.')[0]}.{game_version.split('.')[1]}"
-                has_snapshot = f"{major_game_version}-Snapshot" in file['gameVersions']
-                has_correct_version = game_version in file['gameVersions']
-                has_download_file = file['downloadUrl'] is not None
-                if ((not has_snapshot) or (has_snapshot and has_correct_version)) and has_download_file:
-                    return file
+            file = select_file(map(models.Version.from_curseforge, files), game_version)
+            if file is not None:
+                return file
 
             # If no correct version is found, raise ModVersionNotFoundException
             raise ModVersionNotFoundException(game_version)
@@ -200,6 +243,47 @@ def get_latest_mod_file(mod_id, game_version: str, mod_loader_type: int = 0, pag
             continue
 
 
+async def _fetch_game_version_types():
+    global game_version_types
+
+    versions, version_types = await asyncio.gather(
+        net.get(f"{API_URL}/games/{GAME_ID}/versions", "game versions", headers=headers),
+        net.get(f"{API_URL}/games/{GAME_ID}/version-types", "game version types", headers=headers)
+    )
+    if versions is None or version_types is None or versions.status_code != 200 or version_types.status_code != 200:
+        print("Error: Couldn't fetch the game versions, files will be filtered locally")
+        return None
+
+    # Only the Minecraft version groups, other types (e.g. mod loaders) use the same table
+    minecraft_types = {
+        version_type['id'] for version_type in utils.json_loads(version_types.content)['data']
+        if version_type['slug'].startswith('minecraft-')
+    }
+    game_version_types = {
+        version: group['type']
+        for group in utils.json_loads(versions.content)['data'] if group['type'] in minecraft_types
+        for version in group['versions']
+    }
+    return game_version_types
+
+
+async def get_game_version_types_async():
+    """
+    Returns a dict of game version -> gameVersionTypeId, fetched with two requests the first time. \n
+    Concurrent callers share those requests. Returns None if the tables could not be fetched. \n
+    """
+
+    global _game_version_types_task
+    if game_version_types is not None:
+        return game_version_types
+
+    loop = asyncio.get_running_loop()
+    if _game_version_types_task is None or _game_version_types_task.get_loop() is not loop:
+        _game_version_types_task = loop.create_task(_fetch_game_version_types())
+    # Shielded, so a caller that is cancelled doesn't cancel the fetch for the others
+    return await asyncio.shield(_game_version_types_task)
+
+
 async def get_latest_mod_file_async(
         mod_id: int, game_version: str,
         mod_loader_type: int = 0, page_size: int = 200,
@@ -208,6 +292,8 @@ async def get_latest_mod_file_async(
     """
     Returns the latest file that matches the params. \n
     Returns None if no mod or file was found. \n
+    Known game versions are filtered by the API with gameVersionTypeId and a small page,
+    other versions fall back to scanning page_size files. \n
     Functions are called before and after making a http request. \n
 
     Mod loader type can be: \n
@@ -220,48 +306,146 @@ async def get_latest_mod_file_async(
     Modloader defaults to 0.
     """
 
-    timeout = httpx.Timeout(30)
-    attempt = 0
     url = f"{API_URL}/mods/{mod_id}/files"
     params = {
         'gameVersion': game_version,
         'modLoaderType': mod_loader_type,
         'pageSize': page_size
     }
-    async with httpx.AsyncClient(headers=headers, timeout=timeout) as client:
-        while True:
-            if attempt >= 3:
-                print(f"Error: Max attempts made for '{mod_id}'")
-                return
-
-            try:
-                if before_response_funcs is not None:
-                    request_object = client.build_request(method="GET", url=url, headers=headers, params=params)
-                    for before_response_func in before_response_funcs:
-                        await before_response_func(request_object)
-
-                response = await client.get(url, params=params)
-
-                correct_file = None
-                for file in response.json()['data']:
-                    major_game_version = f"{game_version.split('.')[0]}.{game_version.split('.')[1]}"
-                    has_snapshot = f"{major_game_version}-Snapshot" in file['gameVersions']
-                    has_correct_version = game_version in file['gameVersions']
-                    has_download_file = file['downloadUrl'] is not None
-                    if ((not has_snapshot) or (has_snapshot and has_correct_version)) and has_download_file:
-                        correct_file = file
-                        break
-
-                if after_response_funcs is not None:
-                    for response_func in after_response_funcs:
-                        await response_func(response, correct_file)
 
+    # If the version is in the version tables, the API filters on the exact version and a few files are enough
+    version_types = await get_game_version_types_async()
+    if version_types is not None and game_version in version_types:
+        filtered_params = {
+            **params,
+            'gameVersionTypeId': version_types[game_version],
+            'pageSize': FILTERED_PAGE_SIZE
+        }
+        response = await net.get(url, f"'{mod_id}'", before_response_funcs, params=filtered_params, headers=headers)
+        if response is None:
+            return
+
+        if response.status_code == 200:
+            body = utils.json_loads(response.content)
+            files = [models.Version.from_curseforge(file) for file in body['data']]
+            correct_file = next((file for file in files if file.file.url is not None), None)
+            # Only scan further if every file on the page was without download URL and there are more
+            if correct_file is not None or len(files) >= body['pagination']['totalCount']:
+                await net.call_after_response_funcs(after_response_funcs, response, correct_file)
                 return correct_file
-            except IndexError:
-                return
-            except httpx.ReadTimeout:
-                attempt += 1
-                print(f"Error: httpx.ReadTimeout for '{mod_id}', trying again ({attempt})")
-            except httpx.ConnectTimeout:
-                attempt += 1
-                print(f"Error: httpx.ConnectTimeout for '{mod_id}', trying again ({attempt})")
+        before_response_funcs = None
+
+    response = await net.get(url, f"'{mod_id}'", before_response_funcs, params=params, headers=headers)
+    if response is None:
+        return
+
+    correct_file = None
+    if response.status_code == 200:
+        files = utils.json_loads(response.content)['data']
+        correct_file = select_file(map(models.Version.from_curseforge, files), game_version)
+
+    await net.call_after_response_funcs(after_response_funcs, response, correct_file)
+    return correct_file
+
+
+async def get_mod_files_async(mod_id: int, page_size: int = 50):
+    """
+    Returns all files of the mod, newest first, without filtering on game version or mod loader. \n
+    Returns None if the files could not be fetched. \n
+    """
+
+    url = f"{API_URL}/mods/{mod_id}/files"
+    files = []
+    while True:
+        params = {'index': len(files), 'pageSize': page_size}
+        response = await net.get(url, f"'{mod_id}'", params=params, headers=headers)
+        if response is None or response.status_code != 200:
+            return
+
+        body = utils.json_loads(response.content)
+        files.extend(models.Version.from_curseforge(file) for file in body['data'])
+        if not body['data'] or len(files) >= body['pagination']['totalCount']:
+            return files
+
+
+async def search_mods_async(index: int = 0, page_size: int = 50, sort_field: int = 3, search_filter: str = None):
+    """
+    Returns a page of search results for mods, with 'data' and 'pagination'. \n
+    Returns None if the page could not be fetched. \n
+
+    Sort field can be: \n
+    1=Featured \n
+    2=Popularity \n
+    3=LastUpdated \n
+    4=Name \n
+    6=TotalDownloads \n
+    Sorting is always descending.
+    """
+
+    params = {
+        'gameId': GAME_ID,
+        'classId': CATEGORY_ID,
+        'sortField': sort_field,
+        'sortOrder': 'desc',
+        'index': index,
+        'pageSize': page_size
+    }
+    if search_filter:
+        params['searchFilter'] = search_filter
+
+    response = await net.get(f"{API_URL}/mods/search", f"search page {index}", params=params, headers=headers)
+    if response is None or response.status_code != 200:
+        return
+    return utils.json_loads(response.content)
+
+
+async def _post_async(url: str, body: dict, name: str):
+    """
+    Returns the decoded data of the response, or None if the request failed. \n
+    """
+
+    response = await net.post(url, name, json=body, headers=headers)
+    if response is None or response.status_code != 200:
+        return
+    return utils.json_loads(response.content)['data']
+
+
+async def get_mods_async(mod_ids: typing.List[int]):
+    """
+    Returns the mods with the given IDs in one request. \n
+    Returns None if the request failed. \n
+    """
+
+    mods = await _post_async(f"{API_URL}/mods", {'modIds': mod_ids}, f"{len(mod_ids)} mods")
+    if mods is None:
+        return
+    return [models.Project.from_curseforge(mod) for mod in mods]
+
+
+async def get_files_async(file_ids: typing.List[int]):
+    """
+    Returns the files with the given IDs in one request. \n
+    Returns None if the request failed. \n
+    """
+
+    files = await _post_async(f"{API_URL}/mods/files", {'fileIds': file_ids}, f"{len(file_ids)} files")
+    if files is None:
+        return
+    return [models.Version.from_curseforge(file) for file in files]
+
+
+async def get_files_from_fingerprints_async(fingerprints: typing.List[int]):
+    """
+    Returns a dict of fingerprint -> file for the files CurseForge knows, in one request. \n
+    Returns None if the request failed. \n
+    """
+
+    data = await _post_async(
+        f"{API_URL}/fingerprints/{GAME_ID}", {'fingerprints': fingerprints}, f"{len(fingerprints)} fingerprints"
+    )
+    if data is None:
+        return
+    return {
+        match['file']['fileFingerprint']: models.Version.from_curseforge(match['file'])
+        for match in data['exactMatches']
+    }
@@ -0,0 +1,319 @@
+import os
+import time
+import typing
+import logging
+import queue
+import pathlib
+import threading
+import urllib.parse
+import requests
+
+import utils
+
+
+# Priority classes, lower numbers are downloaded first
+REQUIRED = 0  # Mods that other mods in the list depend on
+NORMAL = 1
+OPTIONAL = 2
+
+CHUNK_SIZE = 64 * 1024
+HOST_CONNECTIONS = 4  # Concurrent downloads per host
+WORKERS = 8
+TIMEOUT = 30
+RATE_CHECK_INTERVAL = 1  # Seconds between checks of the rate file
+
+RATE_UNITS = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3}
+
+
+def parse_rate(text: str):
+    """
+    Returns the bytes per second of a rate like '500k' or '2M', None for '0' or an empty string (no limit). \n
+    Raises ValueError if the text is not a rate. \n
+    """
+
+    value = text.strip().lower().removesuffix('/s').removesuffix('b')
+    if not value:
+        return None
+    unit = value[-1:] if value[-1:] in RATE_UNITS else ''
+    try:
+        rate = float(value.removesuffix(unit)) * RATE_UNITS[unit]
+    except ValueError:
+        rate = -1
+    if not 0 <= rate < float('inf'):
+        raise ValueError(f"'{text.strip()}' is not a rate like 500k or 2M")
+    return rate or None
+
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by all downloads, so together they stay under rate bytes per second. \n
+    The rate can be changed at any time, also while downloads are running, with set_rate or by
+    following a file that contains the rate (see follow). \n
+    """
+
+    def __init__(self, rate: float = None):
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._rate_file: typing.Optional[str] = None
+        self._rate_file_mtime = None
+        self._rate_file_checked = 0.0
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate: typing.Optional[float]):
+        """
+        Sets the limit in bytes per second, None removes the limit. \n
+        """
+
+        with self._lock:
+            self._rate = rate or None
+            self._tokens = min(self._tokens, self._rate or 0)
+        logging.info(f"Download limit set to {f'{rate / 1024:.0f} KiB/s' if rate else 'unlimited'}")
+
+    def follow(self, path: typing.Optional[str]):
+        """
+        Reads the rate from a file whenever it changes, e.g. 'echo 1M > rate' slows down running downloads. \n
+        """
+
+        self._rate_file = path
+        self._rate_file_mtime = None
+        self._check_rate_file()
+
+    def _check_rate_file(self):
+        now = time.monotonic()
+        if self._rate_file is None or now - self._rate_file_checked < RATE_CHECK_INTERVAL:
+            return
+        self._rate_file_checked = now
+
+        try:
+            mtime = os.stat(self._rate_file).st_mtime_ns
+            if mtime == self._rate_file_mtime:
+                return
+            self._rate_file_mtime = mtime
+            with open(self._rate_file) as f:
+                self.set_rate(parse_rate(f.read()))
+        except (OSError, ValueError) as e:
+            logging.warning(f"Couldn't read download limit from '{self._rate_file}' ({e})")
+
+    def consume(self, amount: int):
+        """
+        Blocks until amount bytes may be transferred. \n
+        """
+
+        self._check_rate_file()
+        while True:
+            with self._lock:
+                if self._rate is None:
+                    return
+
+                now = time.monotonic()
+                # At most one second of unused bandwidth is saved up, so bursts stay short
+                self._tokens = min(self._tokens + (now - self._last) * self._rate, self._rate)
+                self._last = now
+                if self._tokens >= amount or self._tokens >= self._rate:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self._rate
+            time.sleep(min(wait, RATE_CHECK_INTERVAL))
+            self._check_rate_file()
+
+
+limiter = BandwidthLimiter()
+
+_host_slots: typing.Dict[str, threading.Semaphore] = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(url: str):
+    host = urllib.parse.urlparse(url).netloc
+    with _host_slots_lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(HOST_CONNECTIONS)
+        return _host_slots[host]
+
+
+def set_bandwidth_limit(rate: typing.Optional[float]):
+    """
+    Limits all downloads together to rate bytes per second, None removes the limit. \n
+    """
+
+    limiter.set_rate(rate)
+
+
+class Download:
+    """
+    A file to download and what is known about it beforehand. \n
+    Downloads are started in order of priority, then size, so required mods and small jars come first. \n
+    """
+
+    __slots__ = ('url', 'file_name', 'size', 'sha1', 'priority', 'project_id', 'dependencies')
+
+    def __init__(
+            self, url: str, file_name: str = None, size: int = 0, sha1: str = None, priority: int = NORMAL,
+            project_id: typing.Union[int, str] = None, dependencies: typing.Iterable[typing.Union[int, str]] = ()):
+        self.url = url
+        self.file_name = file_name or utils.get_file_name_from_url(url)
+        self.size = size
+        self.sha1 = sha1
+        self.priority = priority
+        self.project_id = project_id
+        self.dependencies = tuple(dependencies)
+
+    def sort_key(self):
+        return self.priority, self.size or float('inf')
+
+
+def prioritize(downloads: typing.Iterable[Download]):
+    """
+    Moves downloads that other downloads in the list require to the REQUIRED class. \n
+    """
+
+    downloads = list(downloads)
+    required = {dependency for download in downloads for dependency in download.dependencies}
+    for download in downloads:
+        if download.project_id is not None and download.project_id in required:
+            download.priority = min(download.priority, REQUIRED)
+    return downloads
+
+
+def download_file(url: str, path: str, shaper: BandwidthLimiter = None):
+    """
+    Streams url to path, limited by the bandwidth limiter and the connection limit of the host. \n
+    The file is written under a temporary name first, so an interrupted download never leaves half a jar. \n
+    Raises requests.RequestException or OSError if the download fails. \n
+    """
+
+    shaper = shaper or limiter
+    url = utils.proxied_url(url)
+    pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = path + ".part"
+
+    with _host_slot(url):
+        with requests.get(url, stream=True, timeout=TIMEOUT) as response:
+            response.raise_for_status()
+            try:
+                with open(tmp, 'wb') as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        shaper.consume(len(chunk))
+                        f.write(chunk)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+    return path
+
+
+class DownloadPool:
+    """
+    Pool of download workers that files can be added to while it is running, so downloads can start
+    while the rest of the mods are still being resolved. \n
+    Every free worker takes the pending download with the highest priority, mods that a submitted mod
+    depends on are moved to REQUIRED as soon as that is known. \n
+    on_done is called in the thread that calls submit or join, with the exception if the download failed. \n
+    """
+
+    def __init__(
+            self, directory: str, workers: int = WORKERS,
+            on_done: typing.Callable[[Download, typing.Optional[Exception]], None] = None):
+        self.directory = directory
+        self.on_done = on_done
+        self.downloads: typing.List[Download] = []
+        self.failed: typing.Dict[Download, Exception] = {}
+        self._pending: typing.List[Download] = []
+        self._required = set()
+        self._condition = threading.Condition()
+        self._finished = queue.SimpleQueue()  # (download, exception or None) of finished downloads
+        self._reported = 0
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"download-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, *downloads: Download):
+        with self._condition:
+            for download in downloads:
+                self._required.update(download.dependencies)
+                self._pending.append(download)
+                self.downloads.append(download)
+            self._condition.notify(len(downloads))
+        self._report()
+
+    def _next(self):
+        for download in self._pending:
+            if download.project_id is not None and download.project_id in self._required:
+                download.priority = min(download.priority, REQUIRED)
+        download = min(self._pending, key=Download.sort_key)
+        self._pending.remove(download)
+        return download
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                download = self._next()
+
+            error = None
+            try:
+                download_file(download.url, os.path.join(self.directory, download.file_name))
+            except Exception as e:
+                error = e
+            self._finished.put((download, error))
+
+    def _report(self, block: bool = False):
+        while self._reported < len(self.downloads):
+            try:
+                download, error = self._finished.get(block=block)
+            except queue.Empty:
+                return
+            self._reported += 1
+            if error is not None:
+                logging.error(f"Couldn't download '{download.file_name}' ({error})")
+                self.failed[download] = error
+            if self.on_done is not None:
+                self.on_done(download, error)
+
+    def join(self):
+        """
+        Waits until everything that was submitted is downloaded and stops the workers. \n
+        Returns a dict of download -> exception for the downloads that failed. \n
+        """
+
+        self._report(block=True)
+        self.close()
+        return self.failed
+
+    def close(self):
+        """
+        Stops the workers after the downloads that already started, the rest are dropped. \n
+        """
+
+        with self._condition:
+            self._pending.clear()
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+
+def download_all(
+        downloads: typing.Iterable[Download], directory: str, workers: int = WORKERS,
+        on_done: typing.Callable[[Download, typing.Optional[Exception]], None] = None):
+    """
+    Downloads everything into directory with a pool of workers, highest priority first. \n
+    on_done is called in the calling thread after every download, with the exception if it failed. \n
+    Returns a dict of download -> exception for the downloads that failed. \n
+    """
+
+    pool = DownloadPool(directory, workers, on_done)
+    pool.submit(*downloads)
+    return pool.join()
@@ -0,0 +1,139 @@
+import time
+import asyncio
+import collections
+import httpx
+
+
+PERCENTILE = 0.95  # Hedge requests slower than this percentile of the run
+MIN_SAMPLES = 20  # Latencies needed before hedging starts
+MIN_DELAY = 0.1  # Seconds, never hedge sooner than this
+BUDGET_RATIO = 0.1  # At most this fraction of requests is hedged
+BUDGET_BURST = 10
+POLL_INTERVAL = 0.25  # Seconds between percentile checks while there are not enough samples
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent successful requests. \n
+    """
+
+    def __init__(self, size: int = 500):
+        self._latencies = collections.deque(maxlen=size)
+
+    def record(self, latency: float):
+        self._latencies.append(latency)
+
+    def percentile(self, percentile: float):
+        """
+        Returns the latency at the percentile, or None if there are not enough samples yet. \n
+        """
+
+        if len(self._latencies) < MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        return latencies[min(int(len(latencies) * percentile), len(latencies) - 1)]
+
+
+class HedgeBudget:
+    """
+    Token bucket that limits the number of hedged requests. \n
+    Every request adds ratio tokens, every hedge costs one. \n
+    """
+
+    def __init__(self, ratio: float = BUDGET_RATIO, burst: float = BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+
+    def on_request(self):
+        self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self):
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+enabled = True
+tracker = LatencyTracker()
+budget = HedgeBudget()
+stats = {'requests': 0, 'hedged': 0, 'hedge_won': 0}
+
+
+def set_enabled(value: bool):
+    global enabled
+    enabled = value
+
+
+async def _timed_get(client: httpx.AsyncClient, url, kwargs):
+    start = time.perf_counter()
+    response = await client.get(url, **kwargs)
+    return response, time.perf_counter() - start
+
+
+async def get(client: httpx.AsyncClient, url, **kwargs):
+    """
+    Same as client.get, for idempotent requests only. \n
+    If there is no response after the learned latency percentile, a second copy of the request is sent,
+    the first response is returned and the other request is cancelled. \n
+    """
+
+    stats['requests'] += 1
+    budget.on_request()
+
+    first = asyncio.ensure_future(_timed_get(client, url, kwargs))
+    second = None
+    # The copies are cancelled however this returns, also when the caller is cancelled while waiting
+    try:
+        if not enabled:
+            response, latency = await first
+            tracker.record(latency)
+            return response
+
+        # The percentile is checked again while waiting, requests started before
+        # enough latencies were known can still be hedged
+        start = time.perf_counter()
+        while True:
+            delay = tracker.percentile(PERCENTILE)
+            if delay is not None:
+                delay = max(delay, MIN_DELAY)
+            timeout = POLL_INTERVAL if delay is None else delay - (time.perf_counter() - start)
+
+            done, _ = await asyncio.wait({first}, timeout=max(timeout, 0))
+            if done:
+                response, latency = first.result()
+                tracker.record(latency)
+                return response
+
+            if delay is not None and time.perf_counter() - start >= delay:
+                break
+
+        if not budget.try_spend():
+            response, latency = await first
+            tracker.record(latency)
+            return response
+
+        stats['hedged'] += 1
+        second = asyncio.ensure_future(_timed_get(client, url, kwargs))
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            successful = [task for task in done if task.exception() is None]
+            if not successful:
+                # Only fail if both copies failed
+                if not pending:
+                    raise done.pop().exception()
+                continue
+
+            task = first if first in successful else second
+            response, latency = task.result()
+            if task is second:
+                stats['hedge_won'] += 1
+                latency += delay
+            tracker.record(latency)
+            return response
+    finally:
+        for task in (first, second):
+            if task is not None:
+                task.cancel()
@@ -0,0 +1,263 @@
+import os
+import time
+import shutil
+import typing
+import logging
+import zipfile
+
+import utils
+import downloads
+
+
+STAGING_SUFFIX = ".staging"
+PREVIOUS_SUFFIX = ".previous"
+SWAP_SUFFIX = ".swap"
+RETIRED_SUFFIX = ".retired"
+
+
+class InstallError(Exception):
+    """
+    Exception raised when a staged install can't be verified or swapped in.
+
+    Attributes:
+        path -- file or folder which caused the error
+        message -- explanation of the error
+    """
+
+    def __init__(self, path, message="Staged install failed"):
+        self.path = path
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"'{self.path}' -> {self.message}"
+
+
+def _is_mod(name: str):
+    return name.endswith(".jar")
+
+
+def _move_extras(src: str, dst: str):
+    """
+    Moves everything that is not a mod jar (configs, backup folders, ...) from src to dst. \n
+    Both folders are siblings, so every move is a rename. \n
+    """
+
+    for name in os.listdir(src):
+        if not _is_mod(name) and not os.path.exists(os.path.join(dst, name)):
+            os.rename(os.path.join(src, name), os.path.join(dst, name))
+
+
+def _swap(a: str, b: str):
+    """
+    Exchanges the names of two sibling folders. \n
+    """
+
+    tmp = a + SWAP_SUFFIX
+    os.rename(a, tmp)
+    try:
+        os.rename(b, a)
+    except OSError:
+        os.rename(tmp, a)
+        raise
+    os.rename(tmp, b)
+
+
+def verify_jar(path: str):
+    """
+    Raises InstallError if the file is not a readable jar. \n
+    """
+
+    try:
+        with zipfile.ZipFile(path):
+            pass
+    except (zipfile.BadZipFile, OSError):
+        raise InstallError(path, "File is not a valid jar")
+
+
+class StagedInstall:
+    """
+    Installs a complete set of mods next to the live mods folder and swaps it in with renames. \n
+    The live folder is untouched until commit, which only renames folders, so a running server never
+    sees a half-updated mods folder. The replaced folder is kept as '<mods folder>.previous' until the next
+    install, so rollback can swap it back at any time. \n
+    """
+
+    def __init__(self, mods_folder: str):
+        self.mods_folder = os.path.abspath(mods_folder.rstrip("/\\"))
+        self.staging_folder = self.mods_folder + STAGING_SUFFIX
+        self.previous_folder = self.mods_folder + PREVIOUS_SUFFIX
+        self.hashes: typing.Dict[str, typing.Optional[str]] = {}
+
+        # Leftovers of an install that was interrupted before the swap
+        if os.path.exists(self.staging_folder):
+            shutil.rmtree(self.staging_folder)
+        os.makedirs(self.staging_folder)
+
+    def download(self, url: str, file_name: str = None, sha1: str = None):
+        """
+        Downloads a mod into the staging folder and returns its path. \n
+        sha1 is checked in verify, if it is known. \n
+        """
+
+        if file_name is None:
+            file_name = utils.get_file_name_from_url(url)
+        path = downloads.download_file(url, os.path.join(self.staging_folder, file_name))
+        self.hashes[path] = sha1
+        return path
+
+    def download_all(
+            self, files: typing.Iterable[downloads.Download],
+            on_done: typing.Callable[[downloads.Download, typing.Optional[Exception]], None] = None):
+        """
+        Downloads the files into the staging folder in priority order, see downloads.download_all. \n
+        Raises InstallError if any download failed. \n
+        """
+
+        pool = self.download_pool(on_done)
+        pool.submit(*files)
+        self.join_downloads(pool)
+
+    def download_pool(
+            self, on_done: typing.Callable[[downloads.Download, typing.Optional[Exception]], None] = None):
+        """
+        Returns a download pool for the staging folder, to start downloads before all mods are known.
+        Pass it to join_downloads when everything is submitted. \n
+        """
+
+        return downloads.DownloadPool(self.staging_folder, on_done=on_done)
+
+    def join_downloads(self, pool: downloads.DownloadPool):
+        """
+        Waits for the downloads of the pool and registers them for verify. \n
+        Raises InstallError if any download failed. \n
+        """
+
+        failed = pool.join()
+        if failed:
+            download, error = next(iter(failed.items()))
+            raise InstallError(download.url, f"{len(failed)} downloads failed, e.g. '{download.file_name}' ({error})")
+        for download in pool.downloads:
+            self.hashes[os.path.join(self.staging_folder, download.file_name)] = download.sha1
+
+    def reuse(self, file_name: str, sha1: str = None):
+        """
+        Links a jar that is already in the live mods folder into the staging folder, so unchanged mods
+        are not downloaded again. \n
+        Returns the staged path, or None if the live folder doesn't have the file. \n
+        """
+
+        src = os.path.join(self.mods_folder, file_name)
+        if not os.path.isfile(src):
+            return None
+
+        path = os.path.join(self.staging_folder, file_name)
+        try:
+            os.link(src, path)
+        except OSError:
+            shutil.copy2(src, path)
+        self.hashes[path] = sha1
+        return path
+
+    def add(self, path: str, sha1: str = None):
+        """
+        Registers a file that was already put in the staging folder, e.g. by snapshot.Snapshot.install. \n
+        """
+
+        self.hashes[os.path.abspath(path)] = sha1
+
+    def verify(self):
+        """
+        Raises InstallError for the first staged file that is missing, corrupt or not a jar. \n
+        """
+
+        for path in self.hashes:
+            if not os.path.isfile(path):
+                raise InstallError(path, "File was not downloaded")
+            verify_jar(path)
+
+        known = [path for path, sha1 in self.hashes.items() if sha1]
+        digests = utils.hash_files(known, algorithms=('sha1',), cache=utils.HashCache(location=None))
+        for path in known:
+            if digests[path]['sha1'] != self.hashes[path]:
+                raise InstallError(path, "Hash does not match, the download is corrupt")
+
+    def commit(self, backup: bool = False):
+        """
+        Verifies the staged mods and swaps them in. \n
+        The folder that was replaced becomes the rollback target, the one from the install before is deleted,
+        or kept as a dated backup folder if backup is True. \n
+        """
+
+        self.verify()
+
+        # The rollback target of the install before is only moved aside until the swap succeeded,
+        # so a failed swap leaves both the mods folder and its rollback target as they were
+        retired_folder = self.previous_folder + RETIRED_SUFFIX
+        if os.path.exists(retired_folder):
+            # Left over from an interrupted commit
+            if os.path.exists(self.previous_folder):
+                shutil.rmtree(retired_folder)
+            else:
+                os.rename(retired_folder, self.previous_folder)
+        if os.path.exists(self.previous_folder):
+            os.rename(self.previous_folder, retired_folder)
+
+        try:
+            self._swap_in()
+        except BaseException:
+            if os.path.exists(retired_folder) and not os.path.exists(self.previous_folder):
+                os.rename(retired_folder, self.previous_folder)
+            raise
+
+        if os.path.exists(retired_folder):
+            if backup:
+                name = f"{self.mods_folder} Backup {time.strftime('%Y-%m-%d %H.%M.%S', time.localtime())}"
+                logging.info(f"Keeping previous mods as '{name}'")
+                os.rename(retired_folder, name)
+            else:
+                shutil.rmtree(retired_folder)
+
+    def _swap_in(self):
+        if not os.path.exists(self.mods_folder):
+            os.rename(self.staging_folder, self.mods_folder)
+            logging.info(f"Installed {len(self.hashes)} mods in '{self.mods_folder}'")
+            return
+
+        _move_extras(self.mods_folder, self.staging_folder)
+        try:
+            os.rename(self.mods_folder, self.previous_folder)
+        except OSError:
+            _move_extras(self.staging_folder, self.mods_folder)
+            raise InstallError(self.mods_folder, "Mods folder is in use and can't be renamed")
+        try:
+            os.rename(self.staging_folder, self.mods_folder)
+        except OSError:
+            os.rename(self.previous_folder, self.mods_folder)
+            _move_extras(self.staging_folder, self.mods_folder)
+            raise InstallError(self.staging_folder, "Staged mods could not be swapped in")
+        logging.info(f"Swapped in {len(self.hashes)} mods, the old mods folder is kept for rollback")
+
+    def abort(self):
+        """
+        Deletes the staging folder, the live mods folder was never touched. \n
+        """
+
+        shutil.rmtree(self.staging_folder, ignore_errors=True)
+
+
+def rollback(mods_folder: str):
+    """
+    Swaps the mods folder with the one it replaced in the last staged install. \n
+    Running it again undoes the rollback. \n
+    Raises InstallError if there is nothing to roll back to. \n
+    """
+
+    mods_folder = os.path.abspath(mods_folder.rstrip("/\\"))
+    previous_folder = mods_folder + PREVIOUS_SUFFIX
+    if not os.path.isdir(previous_folder):
+        raise InstallError(mods_folder, "There is no previous mods folder to roll back to")
+
+    _move_extras(mods_folder, previous_folder)
+    _swap(mods_folder, previous_folder)
+    logging.info(f"Rolled back '{mods_folder}'")
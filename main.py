@@ -2,13 +2,12 @@ import os
 import sys
 import time
 import json
-import httpx
 import shutil
-import asyncio
 import logging
 import pathlib
 import platform
 import requests
+import multiprocessing
 from dotenv import load_dotenv
 
 from PyQt5 import QtGui
@@ -16,8 +15,18 @@ from PyQt5 import QtCore
 from PyQt5.uic import loadUi
 from PyQt5.QtWidgets import *
 
+import hedge
 import utils
-import modrinth
+import proxy
+import catalog
+import install
+import pack
+import downloads
+import modpack
+import results
+import pipeline
+import snapshot
+import profiling
 import curseforge
 from resources.gui.api_warning import ApiWarningPopup
 from resources.gui.failed_mods import FailedModsPopup
@@ -40,6 +49,19 @@ class UI(QMainWindow):
         self.downloadable_mod_widgets: list[QWidget] = []
         self.failed_mods: list[str] = []
         self.api_warning_ignore = False
+        self.offline_snapshot = ""
+        self.proxy_url = ""
+        self.hedge_requests = True
+        self.staged_install = False
+        self.bandwidth_limit = ""
+        self.profiling = False
+        self.provider_fallback = False
+        self.auto_download = False
+        self.server_pack = ""
+        self.server_pack_config = ""
+        self.provider_preference: list[str] = []
+        self.mod_downloads: dict[str, downloads.Download] = {}
+        self.results = results.ResultStore()
 
         # Load ui file
         loadUi(utils.resource_path("resources/gui/main.ui"), self)
@@ -119,7 +141,9 @@ class UI(QMainWindow):
         self.folder_input.setText(directory)
         logging.info(f"Changed directory from '{previous}' to '{directory}'\n")
 
-    def make_mod_widget(self, name: str = None, file_url: str = None, details: str = None, logo_url: str = None):
+    def make_mod_widget(
+            self, name: str = None, file_url: str = None, details: str = None,
+            logo_url: str = None, logo_data: bytes = None):
         if not name:
             name = "TESTING"
 
@@ -130,10 +154,13 @@ class UI(QMainWindow):
             details = f"File: mod{self.mod_index}\n"\
                       f"Source: this is a test"
 
-        if not logo_url:
+        if logo_data:
+            mod_icon = QtGui.QPixmap()
+            mod_icon.loadFromData(logo_data)
+        elif not logo_url:
             mod_icon = QtGui.QPixmap(utils.resource_path("resources/img/no-icon.png"))
         else:
-            data = requests.get(logo_url).content
+            data = requests.get(utils.proxied_url(logo_url)).content
             mod_icon = QtGui.QPixmap()
             mod_icon.loadFromData(data)
 
@@ -204,20 +231,62 @@ class UI(QMainWindow):
 
         return mod_widget
 
+    def get_profile_labels(self, mods: int):
+        """
+        Returns the settings that affect the speed of a run, so profiles of different runs can be compared. \n
+        """
+
+        return {
+            'mods': mods,
+            'mc_version': self.mc_version_input.text(),
+            'modloader': self.modloader_input.currentText(),
+            'offline_snapshot': bool(self.offline_snapshot),
+            'proxy': bool(self.proxy_url),
+            'hedge_requests': self.hedge_requests,
+            'staged_install': self.staged_install,
+            'bandwidth_limit': self.bandwidth_limit,
+            'auto_download': self.auto_download,
+            'provider_fallback': self.provider_fallback,
+            'backup_mods': self.backup_mods_checkbox.isChecked()
+        }
+
+    def handle_result(self, result: pipeline.Result):
+        """
+        Records a resolved mod in the result store and adds its widget, or adds it to the failed mods. \n
+        """
+
+        self.results.record(result)
+        if not result.ok:
+            self.failed_mods.append(result.url)
+            self.progress_bar.setValue(self.progress_bar.value() + 1)
+            return
+
+        widget = self.make_mod_widget(
+            name=result.project.name,
+            file_url=result.file_url,
+            details=f"File: {result.file_name}\n"
+                    f"Source: {result.provider.display_name}" + (" (fallback)" if result.fallback else ""),
+            logo_data=result.icon
+        )
+        self.mod_downloads[result.file_url] = result.download()
+        self.downloadable_mod_widgets.append(widget)
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+
+    @profiling.profiled('search', lambda self: self.get_profile_labels(
+        sum(1 for _ in utils.iter_urls(self.mods_text_edit.toPlainText().splitlines()))
+    ))
     def search_online(self):
         logging.info("Searching for mods...")
 
         # Reset arrays and remove old mod results
         self.downloadable_mod_widgets = []
         self.failed_mods = []
+        self.mod_downloads = {}
         for widget in self.scroll_area_widget_contents.findChildren(QWidget, "modWidget"):
             widget.deleteLater()
 
-        # Get mod URLs from text box and filter out comments
-        mod_urls = self.mods_text_edit.toPlainText().strip().split("\n")
-        for mod_url in mod_urls:
-            if mod_url.startswith("# "):
-                mod_urls.remove(mod_url)
+        # Get mod URLs from text box without blank lines and comments
+        mod_urls = list(utils.iter_urls(self.mods_text_edit.toPlainText().splitlines()))
 
         self.progress_bar.setValue(0)
         self.progress_bar.setMaximum(len(mod_urls))
@@ -225,126 +294,138 @@ class UI(QMainWindow):
 
         mc_version = self.mc_version_input.text()
         modrinth_mod_loader = self.modloader_input.currentText().lower()
-        if modrinth_mod_loader == "any":
-            curseforge_mod_loader_type = 0
-        elif modrinth_mod_loader == "fabric":
-            curseforge_mod_loader_type = 4
-        elif modrinth_mod_loader == "forge":
-            curseforge_mod_loader_type = 1
-        elif modrinth_mod_loader == "quilt":
-            curseforge_mod_loader_type = 5
-        elif modrinth_mod_loader == "liteloader":
-            curseforge_mod_loader_type = 3
-        elif modrinth_mod_loader == "cauldron":
-            curseforge_mod_loader_type = 2
-
-        async def get_mods(urls: list[str]):
-            async def handle_response_curseforge(response: httpx.Response, mod):
-                url = response.request.url.__str__()
-                slug = url.split("&slug=")[1]
-
-                if mod is None:
-                    logging.error(f"Couldn't find mod '{slug}'")
-                    self.failed_mods.append(f"c {slug}")
-                    self.progress_bar.setValue(self.progress_bar.value() + 1)
-                    return
-
-                file = await curseforge.get_latest_mod_file_async(
-                    mod_id=mod['id'],
-                    game_version=mc_version,
-                    mod_loader_type=curseforge_mod_loader_type
-                )
+        self.results.reset(mc_version, modrinth_mod_loader)
+
+        def get_mods_offline(urls: list[str]):
+            logging.info(f"Resolving mods from snapshot '{self.offline_snapshot}'")
+            with snapshot.Snapshot(self.offline_snapshot) as snap:
+                if snap.game_version != mc_version or snap.mod_loader != modrinth_mod_loader:
+                    logging.warning(f"Snapshot was made for '{snap.game_version}' ({snap.mod_loader})")
+
+                for url in urls:
+                    entry = snap.get(url)
+                    if entry is None:
+                        logging.error(f"Couldn't find '{url}' in snapshot")
+                        self.results.record_failure(url, pipeline.NOT_FOUND, "Mod is not in the snapshot")
+                        self.failed_mods.append(url)
+                        self.progress_bar.setValue(self.progress_bar.value() + 1)
+                        continue
 
-                if file is None:
-                    logging.error(f"Couldn't find correct file for '{slug}'")
-                    self.failed_mods.append(f"c {slug}")
+                    widget = self.make_mod_widget(
+                        name=entry['name'],
+                        file_url=entry['file_url'],
+                        details=f"File: {entry['file_name']}\n"
+                                f"Source: Snapshot ({entry['provider'].capitalize()})",
+                        logo_data=snap.read_icon(entry)
+                    )
+                    self.mod_downloads[entry['file_url']] = downloads.Download(
+                        entry['file_url'], entry['file_name'], sha1=entry['sha1'], project_id=entry['project_id']
+                    )
+                    self.results.record_entry(url, entry)
+                    self.downloadable_mod_widgets.append(widget)
                     self.progress_bar.setValue(self.progress_bar.value() + 1)
-                    return
 
-                if file['downloadUrl'] is None:
-                    logging.error(f"Couldn't find file URL for '{slug}'")
-                    self.failed_mods.append(f"c {slug}")
+        def get_mods_from_modpacks(paths: list[str]):
+            for path in paths:
+                logging.info(f"Importing modpack '{path}'")
+                try:
+                    pack = modpack.import_modpack(path)
+                except modpack.ModpackError as e:
+                    logging.error(e)
+                    self.failed_mods.append(path)
                     self.progress_bar.setValue(self.progress_bar.value() + 1)
-                    return
+                    continue
 
-                logging.info(f"Found file for '{slug}'")
-                mod_name = mod['name']
-                mod_logo_url = mod['logo']['thumbnailUrl']
-                file_url = file['downloadUrl']
-                widget = self.make_mod_widget(
-                    name=mod_name,
-                    file_url=file_url,
-                    details=f"File: {utils.get_file_name_from_url(file_url)}\n"
-                            f"Source: CurseForge",
-                    logo_url=mod_logo_url
-                )
-                self.downloadable_mod_widgets.append(widget)
+                if pack.game_version != mc_version:
+                    logging.warning(f"Modpack '{pack.name}' is made for '{pack.game_version}' ({pack.mod_loader})")
+
+                for entry in pack.mods:
+                    widget = self.make_mod_widget(
+                        name=entry['name'],
+                        file_url=entry['file_url'],
+                        details=f"File: {entry['file_name']}\n"
+                                f"Source: {pack.name} ({entry['provider'].capitalize()})",
+                        logo_url=entry['logo_url']
+                    )
+                    self.mod_downloads[entry['file_url']] = downloads.Download(
+                        entry['file_url'], entry['file_name'], sha1=entry['sha1'], project_id=entry['project_id']
+                    )
+                    self.downloadable_mod_widgets.append(widget)
+                self.failed_mods.extend(pack.failed)
                 self.progress_bar.setValue(self.progress_bar.value() + 1)
 
-            async def handle_response_modrinth(response: httpx.Response, mod):
-                url = response.request.url.__str__()
-                slug = url.split('/')[-1]
+        # Lines can also be paths to modpacks, their mods are resolved by ID instead of by slug
+        modpack_paths = [url for url in mod_urls if modpack.is_modpack(url) and os.path.isfile(url)]
+        mod_urls = [url for url in mod_urls if url not in modpack_paths]
+        get_mods_from_modpacks(modpack_paths)
 
-                if mod is None:
-                    logging.error(f"Couldn't find mod '{slug}'")
-                    self.failed_mods.append(f"m {slug}")
-                    self.progress_bar.setValue(self.progress_bar.value() + 1)
-                    return
-
-                file = await modrinth.get_latest_mod_file_async(
-                    mod_slug=mod['slug'],
-                    game_version=mc_version,
-                    mod_loader=modrinth_mod_loader
-                )
+        if self.offline_snapshot:
+            get_mods_offline(mod_urls)
+        elif self.auto_download:
+            self.resolve_and_download(mod_urls, mc_version, modrinth_mod_loader)
+        else:
+            pipeline.resolve(
+                mod_urls, mc_version, modrinth_mod_loader, on_result=self.handle_result, fetch_icons=True,
+                fallback=self.provider_fallback, preference=self.provider_preference
+            )
+            logging.info(f"Hedged {hedge.stats['hedged']} of {hedge.stats['requests']} requests, "
+                         f"{hedge.stats['hedge_won']} hedges were faster")
+        self.results.save()
+        self.progress_bar.hide()
+        self.show_results()
 
-                if file is None:
-                    logging.error(f"Couldn't find correct file for '{slug}'")
-                    self.failed_mods.append(f"m {slug}")
-                    self.progress_bar.setValue(self.progress_bar.value() + 1)
-                    return
+    def resolve_and_download(self, mod_urls: list[str], mc_version: str, mod_loader: str):
+        """
+        Auto-confirm mode: every mod starts downloading as soon as its file is resolved, instead of after
+        the download button, mods from modpacks in the list are downloaded as well. \n
+        With staged installs the mods are swapped in when everything is downloaded. \n
+        """
 
-                logging.info(f"Found file for '{slug}'")
-                mod_name = mod['title']
-                mod_logo_url = mod['icon_url']
-                file_url = file['files'][0]['url']
-                widget = self.make_mod_widget(
-                    name=mod_name,
-                    file_url=file_url,
-                    details=f"File: {utils.get_file_name_from_url(file_url)}\n"
-                            f"Source: Modrinth",
-                    logo_url=mod_logo_url
-                )
-                self.downloadable_mod_widgets.append(widget)
-                self.progress_bar.setValue(self.progress_bar.value() + 1)
+        mod_folder = self.folder_input.text()
+        make_backup = self.backup_mods_checkbox.isChecked()
+        self.progress_bar.setMaximum(self.progress_bar.maximum() + len(mod_urls) + len(self.mod_downloads))
 
-            tasks = []
-            for url in urls:
-                slug = utils.get_slug_from_url(url)
-                if "curseforge.com/minecraft/mc-mods/" in url:
-                    if not curseforge.get_api_key():
-                        logging.error(f"Cannot search for '{url}' because API key is not set")
-                        self.failed_mods.append(f"c {slug}")
-                        continue
+        staged = None
+        if self.staged_install:
+            staged = install.StagedInstall(mod_folder)
+            pool = staged.download_pool(on_done=self.on_download_done)
+        else:
+            if make_backup:
+                self.backup_mods(mod_folder)
+            pool = downloads.DownloadPool(mod_folder, on_done=self.on_download_done)
+
+        def on_result(result: pipeline.Result):
+            # Every resolved mod is downloaded as well, which is a step of its own
+            if result.ok:
+                self.progress_bar.setMaximum(self.progress_bar.maximum() + 1)
+            self.handle_result(result)
+
+        try:
+            pool.submit(*self.mod_downloads.values())
+            pipeline.resolve_and_download(
+                mod_urls, mc_version, mod_loader, pool, on_result=on_result, fetch_icons=True,
+                fallback=self.provider_fallback, preference=self.provider_preference
+            )
+            if staged is not None:
+                staged.join_downloads(pool)
+                staged.commit(backup=make_backup)
+            else:
+                pool.join()
+        except (install.InstallError, OSError) as e:
+            pool.close()
+            if staged is not None:
+                logging.error(f"Staged install failed, the mods folder was not changed ({e})")
+                staged.abort()
+            else:
+                logging.error(e)
+        downloaded = len(pool.downloads) - len(pool.failed)
+        logging.info(f"Downloaded {downloaded} of {len(pool.downloads)} mods while resolving")
+        self.build_server_pack(mod_folder)
 
-                    logging.info(f"Looking for '{slug}' using Curseforge")
-                    tasks.append(curseforge.get_mod_from_slug_async(
-                        slug=slug,
-                        after_response_funcs=[handle_response_curseforge]
-                    ))
-                elif "modrinth.com/mod/" in url:
-                    logging.info(f"Looking for '{slug}' using Modrinth")
-                    tasks.append(modrinth.get_mod_from_slug_async(
-                        mod_slug=slug,
-                        after_response_funcs=[handle_response_modrinth]
-                    ))
-                else:
-                    logging.error(f"URL '{url}' is not supported")
-                    self.failed_mods.append(url)
-
-            return await asyncio.gather(*tasks)
-
-        asyncio.run(get_mods(mod_urls))
-        self.progress_bar.hide()
+    def show_results(self):
+        """
+        Adds the new mod widgets to the layout and shows the failed mods, with the option to retry them. \n
+        """
 
         # Alphabetically add widgets to layout
         self.downloadable_mod_widgets.sort(key=lambda widget: widget.findChild(QLabel, "modName").text())
@@ -354,75 +435,204 @@ class UI(QMainWindow):
         # Popup for failed mods
         if self.failed_mods:
             logging.info("Creating popup showing what mods failed")
-            urls: list[str] = []
-            for mod in self.failed_mods:
-                mod: str = mod
-                if mod.startswith("c "):
-                    slug = mod.removeprefix("c ")
-                    url = f"https://www.curseforge.com/minecraft/mc-mods/{slug}"
-                    urls.append(url)
-                    continue
-
-                if mod.startswith("m "):
-                    slug = mod.removeprefix("m ")
-                    url = f"https://modrinth.com/mod/{slug}"
-                    urls.append(url)
-                    continue
+            urls = sorted(self.failed_mods, key=lambda url: utils.get_slug_from_url(url))
 
-                urls.append(mod)
-            urls.sort(key=lambda url: utils.get_slug_from_url(url))
+            # Suggest corrections for typos from the local catalog, if it was built
+            suggestions = {}
+            mod_catalog = catalog.open_catalog()
+            if mod_catalog is not None:
+                with mod_catalog:
+                    suggestions = {url: mod_catalog.suggest_url(url) for url in urls}
 
+            errors = {url: self.results.entries[url]['error'] for url in urls if url in self.results.entries}
             self.failed_mods_popup = FailedModsPopup()
-            self.failed_mods_popup.set_mod_urls(urls)
+            self.failed_mods_popup.set_mod_urls(urls, suggestions, errors)
+            self.failed_mods_popup.set_retry_enabled(bool(self.results.failed()))
             self.failed_mods_popup.exec_()
 
+            logging.info("Done\n")
+            if self.failed_mods_popup.retry_requested():
+                self.retry_failed()
+            return
+
         logging.info("Done\n")
 
+    def retry_failed(self):
+        """
+        Resolves only the mods that failed in the last search again and adds them to the results. \n
+        If no results are shown, e.g. after a restart, the mods that succeeded are shown from the result store. \n
+        """
+
+        failed = self.results.failed()
+        if not failed:
+            logging.info("No failed mods to retry\n")
+            return
+        logging.info(f"Retrying {len(failed)} failed mods...")
+
+        self.downloadable_mod_widgets = []
+        self.failed_mods = []
+        if not self.scroll_area_widget_contents.findChildren(QWidget, "modWidget"):
+            for entry in self.results.succeeded().values():
+                widget = self.make_mod_widget(
+                    name=entry['name'],
+                    file_url=entry['file_url'],
+                    details=f"File: {entry['file_name']}\n"
+                            f"Source: {entry['provider'].capitalize()}"
+                )
+                self.mod_downloads[entry['file_url']] = downloads.Download(
+                    entry['file_url'], entry['file_name'], entry['size'], entry['sha1'],
+                    project_id=entry['project_id'], dependencies=entry['dependencies']
+                )
+                self.downloadable_mod_widgets.append(widget)
+
+        self.progress_bar.setValue(0)
+        self.progress_bar.setMaximum(len(failed))
+        self.progress_bar.show()
+        results.retry_failed(
+            self.results, on_result=self.handle_result, fetch_icons=True,
+            fallback=self.provider_fallback, preference=self.provider_preference
+        )
+        self.progress_bar.hide()
+        self.show_results()
+
+    @profiling.profiled('download', lambda self: self.get_profile_labels(
+        len(self.scroll_area_widget_contents.findChildren(QWidget, "modWidget"))
+    ))
     def download_mods(self):
         logging.info("Downloading mods...")
         make_backup: bool = self.backup_mods_checkbox.isChecked()
         mod_folder = self.folder_input.text()
 
+        if self.staged_install:
+            self.download_mods_staged(mod_folder, make_backup)
+            self.build_server_pack(mod_folder)
+            return
+
         if not make_backup:
             logging.info("Not making backup, because checkbox is not checked")
         else:
-            logging.info("Making backup")
-            new_folder = "Backup " + time.strftime("%Y-%m-%d %H.%M.%S", time.localtime())
-            if not os.path.exists(mod_folder):
-                logging.warning("Mods folder not found, creating it")
-                pathlib.Path(mod_folder).mkdir(parents=True, exist_ok=True)
+            self.backup_mods(mod_folder)
+
+        snap = snapshot.Snapshot(self.offline_snapshot) if self.offline_snapshot else None
+        entries = self.get_snapshot_entries(snap)
+        to_download = self.get_downloads(snap)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setMaximum(len(entries) + len(to_download))
+        self.progress_bar.show()
 
-            if any(f.endswith(".jar") for f in os.listdir(mod_folder)):
-                os.mkdir(os.path.join(mod_folder, new_folder))
+        for entry in entries:
+            logging.info(f"Installing '{entry['file_name']}' from snapshot")
+            snap.install(entry, mod_folder)
+            self.progress_bar.setValue(self.progress_bar.value() + 1)
 
-                logging.info(f"Moving old mods to backup folder named '{new_folder}'...")
+        if snap is not None:
+            snap.close()
+        downloads.download_all(to_download, mod_folder, on_done=self.on_download_done)
+        self.progress_bar.hide()
+        self.build_server_pack(mod_folder)
+        logging.info("Done\n")
 
-                for file in os.listdir(mod_folder):
-                    if os.path.isdir(file) or not file.endswith(".jar"):
-                        continue
+    def build_server_pack(self, mod_folder: str):
+        """
+        Writes the downloaded mods, the config folder and a lockfile to a server pack, if one is set up. \n
+        """
+
+        if not self.server_pack:
+            return
+        try:
+            pack.build_pack(
+                mod_folder, self.server_pack, config_folder=self.server_pack_config or None,
+                game_version=self.results.game_version, mod_loader=self.results.mod_loader,
+                mods=pack.mod_entries(self.results.succeeded().values(), mod_folder)
+            )
+        except (pack.PackError, OSError) as e:
+            logging.error(f"Couldn't build server pack ({e})")
+
+    def backup_mods(self, mod_folder: str):
+        logging.info("Making backup")
+        new_folder = "Backup " + time.strftime("%Y-%m-%d %H.%M.%S", time.localtime())
+        if not os.path.exists(mod_folder):
+            logging.warning("Mods folder not found, creating it")
+            pathlib.Path(mod_folder).mkdir(parents=True, exist_ok=True)
+
+        if any(f.endswith(".jar") for f in os.listdir(mod_folder)):
+            os.mkdir(os.path.join(mod_folder, new_folder))
+
+            logging.info(f"Moving old mods to backup folder named '{new_folder}'...")
+
+            for file in os.listdir(mod_folder):
+                if os.path.isdir(file) or not file.endswith(".jar"):
+                    continue
 
-                    logging.info(f"Moving '{file}' to '{new_folder}'")
+                logging.info(f"Moving '{file}' to '{new_folder}'")
 
-                    src_path = fr"{mod_folder}\{file}"
-                    dst_path = fr"{mod_folder}\{new_folder}\{file}"
-                    shutil.move(src_path, dst_path)
-            logging.info("Done moving old mods")
+                src_path = fr"{mod_folder}\{file}"
+                dst_path = fr"{mod_folder}\{new_folder}\{file}"
+                shutil.move(src_path, dst_path)
+        logging.info("Done moving old mods")
 
-        mod_widgets = self.scroll_area_widget_contents.findChildren(QWidget, "modWidget")
-        mod_widgets.sort(key=lambda widget: widget.findChild(QLabel, "modName").text())
-        self.progress_bar.setValue(0)
-        self.progress_bar.setMaximum(len(mod_widgets))
-        self.progress_bar.show()
-        for i, widget in enumerate(mod_widgets):
-            mod_url = widget.findChild(QLabel, 'modURL').text()
-            file_name = utils.get_file_name_from_url(mod_url)
+    def get_snapshot_entries(self, snap: snapshot.Snapshot = None):
+        """
+        Returns the snapshot entries of the listed mods whose jars are in the snapshot. \n
+        """
+
+        if snap is None:
+            return []
+        entries = []
+        for widget in self.scroll_area_widget_contents.findChildren(QWidget, "modWidget"):
+            entry = snap.get_by_file_url(widget.findChild(QLabel, 'modURL').text())
+            if entry is not None and entry['jar']:
+                entries.append(entry)
+        return entries
 
-            logging.info(f"Downloading '{file_name}'")
+    def get_downloads(self, snap: snapshot.Snapshot = None):
+        """
+        Returns the listed mods that have to be downloaded, required dependencies are marked to go first. \n
+        """
 
-            utils.download_file_from_url(url=mod_url, directory=mod_folder)
-            self.progress_bar.setValue(self.progress_bar.value() + 1)
+        to_download = []
+        for widget in self.scroll_area_widget_contents.findChildren(QWidget, "modWidget"):
+            mod_url = widget.findChild(QLabel, 'modURL').text()
+            entry = snap.get_by_file_url(mod_url) if snap is not None else None
+            if entry is None or not entry['jar']:
+                to_download.append(self.mod_downloads.get(mod_url) or downloads.Download(mod_url))
+        return downloads.prioritize(to_download)
+
+    def on_download_done(self, download: downloads.Download, error: Exception = None):
+        if error is None:
+            logging.info(f"Downloaded '{download.file_name}'")
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+
+    def download_mods_staged(self, mod_folder: str, make_backup: bool):
+        """
+        Downloads and verifies all mods next to the mods folder and then swaps them in,
+        so the mods folder is only changed by a few renames at the very end. \n
+        """
+
+        logging.info("Staging mods next to the mods folder")
+        staged = install.StagedInstall(mod_folder)
+
+        snap = snapshot.Snapshot(self.offline_snapshot) if self.offline_snapshot else None
+        entries = self.get_snapshot_entries(snap)
+        to_download = self.get_downloads(snap)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setMaximum(len(entries) + len(to_download))
+        self.progress_bar.show()
+        try:
+            for entry in entries:
+                logging.info(f"Staging '{entry['file_name']}' from snapshot")
+                staged.add(snap.install(entry, staged.staging_folder), entry['sha1'])
+                self.progress_bar.setValue(self.progress_bar.value() + 1)
 
-        self.progress_bar.hide()
+            staged.download_all(to_download, on_done=self.on_download_done)
+            staged.commit(backup=make_backup)
+        except (install.InstallError, OSError) as e:
+            logging.error(f"Staged install failed, the mods folder was not changed ({e})")
+            staged.abort()
+        finally:
+            if snap is not None:
+                snap.close()
+            self.progress_bar.hide()
         logging.info("Done\n")
 
     def debug_create_mod(self):
@@ -444,6 +654,17 @@ class UI(QMainWindow):
                 "modloader": self.modloader_input.currentText(),
                 "backup_mods": self.backup_mods_checkbox.isChecked(),
                 "api_warning_ignore": self.api_warning_ignore,
+                "offline_snapshot": self.offline_snapshot,
+                "proxy_url": self.proxy_url,
+                "hedge_requests": self.hedge_requests,
+                "staged_install": self.staged_install,
+                "bandwidth_limit": self.bandwidth_limit,
+                "profiling": self.profiling,
+                "provider_fallback": self.provider_fallback,
+                "auto_download": self.auto_download,
+                "server_pack": self.server_pack,
+                "server_pack_config": self.server_pack_config,
+                "provider_preference": self.provider_preference,
                 "mod_urls": self.mods_text_edit.toPlainText().split("\n")
             }
             json.dump(data, f, indent=4)
@@ -459,6 +680,27 @@ class UI(QMainWindow):
             self.mc_version_input.setText(data.get("mc_version", ""))
             self.modloader_input.setCurrentText(data.get('modloader', "Fabric"))
             self.api_warning_ignore = data.get('api_warning_ignore', False)
+            self.offline_snapshot = data.get('offline_snapshot', "")
+            self.proxy_url = data.get('proxy_url', "")
+            self.hedge_requests = data.get('hedge_requests', True)
+            hedge.set_enabled(self.hedge_requests)
+            self.staged_install = data.get('staged_install', False)
+            self.bandwidth_limit = data.get('bandwidth_limit', "")
+            self.profiling = data.get('profiling', False)
+            profiling.set_enabled(self.profiling)
+            self.provider_fallback = data.get('provider_fallback', False)
+            self.auto_download = data.get('auto_download', False)
+            self.server_pack = data.get('server_pack', "")
+            self.server_pack_config = data.get('server_pack_config', "")
+            self.provider_preference = data.get('provider_preference', [])
+            try:
+                downloads.set_bandwidth_limit(downloads.parse_rate(str(self.bandwidth_limit)))
+            except ValueError as e:
+                logging.error(f"Ignoring the bandwidth_limit setting ({e})")
+                downloads.set_bandwidth_limit(None)
+            if self.proxy_url:
+                logging.info(f"Using proxy '{self.proxy_url}'")
+                proxy.use_proxy(self.proxy_url)
             self.mods_text_edit.setPlainText("\n".join(data.get('mod_urls', [])))
 
         logging.info("Done\n")
@@ -522,6 +764,9 @@ class UI(QMainWindow):
 
 
 if __name__ == '__main__':
+    # Needed for the hashing process pool in the PyInstaller exe
+    multiprocessing.freeze_support()
+
     # Initialize the app
     app = QApplication(sys.argv)
     UIWindow = UI()
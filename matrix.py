@@ -0,0 +1,107 @@
+import csv
+import typing
+import asyncio
+import logging
+
+import net
+import utils
+import providers
+
+
+Combination = typing.Tuple[str, str]  # (game version, mod loader)
+
+
+class MatrixRow:
+    """
+    Availability of one mod for every combination of game version and mod loader. \n
+    files maps a combination to the file name of the latest compatible file, or None. \n
+    """
+
+    __slots__ = ('url', 'name', 'files', 'error')
+
+    def __init__(self, url: str, name: str = None, error: str = None):
+        self.url = url
+        self.name = name or utils.get_slug_from_url(url)
+        self.files: typing.Dict[Combination, typing.Optional[str]] = {}
+        self.error = error
+
+
+async def _evaluate(url: str, combinations: typing.List[Combination]):
+    """
+    Fetches the file list of the mod once and evaluates every combination against it. \n
+    """
+
+    provider = providers.get_provider(url)
+    if provider is None:
+        return MatrixRow(url, error="URL is not supported")
+    if not provider.is_available():
+        return MatrixRow(url, error="API key is not set")
+
+    project = await provider.lookup(utils.get_slug_from_url(url))
+    if project is None:
+        return MatrixRow(url, error="Mod was not found")
+
+    versions = await provider.list_files(project)
+    if versions is None:
+        return MatrixRow(url, project.name, error="Files could not be fetched")
+
+    row = MatrixRow(url, project.name)
+    for game_version, mod_loader in combinations:
+        version = provider.select_file(versions, game_version, mod_loader)
+        row.files[(game_version, mod_loader)] = version.file.file_name if version is not None else None
+    return row
+
+
+def build_matrix(urls: typing.Iterable[str], combinations: typing.List[Combination]):
+    """
+    Returns a MatrixRow for every mod URL, sorted by name. \n
+    The file list of every mod is fetched once, no matter how many combinations are checked:
+    one request on Modrinth, one per 50 files on CurseForge, which pages its file lists. \n
+    """
+
+    async def run():
+        async with net.session():
+            return await asyncio.gather(*(_evaluate(url, combinations) for url in urls))
+
+    rows = asyncio.run(run())
+    for row in rows:
+        if row.error:
+            logging.error(f"'{row.url}' -> {row.error}")
+    return sorted(rows, key=lambda row: row.name.lower())
+
+
+def format_table(rows: typing.List[MatrixRow], combinations: typing.List[Combination]):
+    """
+    Returns the matrix as a plain text table, with a total of available mods per combination. \n
+    """
+
+    header = ["Mod"] + [f"{game_version} {mod_loader}" for game_version, mod_loader in combinations]
+    lines = []
+    for row in rows:
+        if row.error:
+            lines.append([row.name] + ["?"] * len(combinations))
+        else:
+            lines.append([row.name] + ["yes" if row.files[c] else "-" for c in combinations])
+    totals = ["Available"] + [
+        f"{sum(1 for row in rows if not row.error and row.files[c])}/{len(rows)}" for c in combinations
+    ]
+
+    widths = [max(len(line[i]) for line in [header, totals] + lines) for i in range(len(header))]
+    out = []
+    for line in [header] + lines + [totals]:
+        out.append("  ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+    out.insert(1, "  ".join("-" * width for width in widths))
+    out.insert(len(out) - 1, out[1])
+    return "\n".join(out)
+
+
+def write_csv(rows: typing.List[MatrixRow], combinations: typing.List[Combination], path: str):
+    """
+    Writes the matrix to a csv file, cells contain the file name of the compatible file. \n
+    """
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["mod", "url"] + [f"{game_version} {mod_loader}" for game_version, mod_loader in combinations])
+        for row in rows:
+            writer.writerow([row.name, row.url] + [row.files.get(c) or "" for c in combinations])
@@ -0,0 +1,103 @@
+import typing
+import dataclasses
+
+
+# Entries of CurseForge gameVersions that are mod loaders, not game versions
+CURSEFORGE_LOADERS = ('forge', 'fabric', 'quilt', 'neoforge', 'liteloader', 'cauldron')
+
+
+@dataclasses.dataclass
+class Project:
+    """
+    A mod on CurseForge or Modrinth, only the fields the updater uses. \n
+    """
+
+    __slots__ = ('provider', 'id', 'slug', 'name', 'icon_url', 'updated', 'class_id')
+    provider: str
+    id: typing.Union[int, str]
+    slug: str
+    name: str
+    icon_url: typing.Optional[str]
+    updated: str  # ISO date of the last change to the project, e.g. a new file
+    class_id: typing.Optional[int]  # CurseForge project class (mod, resource pack, ...), None if not known
+
+    @classmethod
+    def from_modrinth(cls, data: dict):
+        return cls(
+            'modrinth', data['id'], data['slug'], data['title'], data.get('icon_url'), data.get('updated', ''), None
+        )
+
+    @classmethod
+    def from_curseforge(cls, data: dict):
+        return cls(
+            'curseforge', data['id'], data['slug'], data['name'],
+            (data.get('logo') or {}).get('thumbnailUrl'), data.get('dateModified', ''), data.get('classId')
+        )
+
+
+@dataclasses.dataclass
+class File:
+    """
+    A downloadable file of a version. \n
+    url is None if the author does not allow third party downloads (CurseForge). \n
+    """
+
+    __slots__ = ('file_name', 'url', 'size', 'sha1', 'fingerprint')
+    file_name: str
+    url: typing.Optional[str]
+    size: int
+    sha1: typing.Optional[str]
+    fingerprint: typing.Optional[int]  # CurseForge murmur2 fingerprint
+
+
+@dataclasses.dataclass
+class Version:
+    """
+    A release of a mod for some game versions and mod loaders. \n
+    On CurseForge every file is its own version. \n
+    """
+
+    __slots__ = ('provider', 'id', 'project_id', 'game_versions', 'loaders', 'files', 'date', 'dependencies')
+    provider: str
+    id: typing.Union[int, str]
+    project_id: typing.Union[int, str]
+    game_versions: typing.Tuple[str, ...]
+    loaders: typing.Tuple[str, ...]
+    files: typing.Tuple[File, ...]
+    date: str
+    dependencies: typing.Tuple[typing.Union[int, str], ...]  # IDs of projects the version requires
+
+    @property
+    def file(self):
+        """
+        The primary file of the version. \n
+        """
+
+        return self.files[0]
+
+    @classmethod
+    def from_modrinth(cls, data: dict):
+        files = tuple(File(
+            f['filename'], f['url'], f.get('size', 0), f.get('hashes', {}).get('sha1'), None
+        ) for f in sorted(data['files'], key=lambda f: not f.get('primary', False)))
+        dependencies = tuple(
+            d['project_id'] for d in data.get('dependencies', [])
+            if d.get('dependency_type') == 'required' and d.get('project_id')
+        )
+        return cls(
+            'modrinth', data['id'], data['project_id'],
+            tuple(data['game_versions']), tuple(data['loaders']), files, data.get('date_published', ''), dependencies
+        )
+
+    @classmethod
+    def from_curseforge(cls, data: dict):
+        game_versions = tuple(data['gameVersions'])
+        sha1 = next((h['value'] for h in data.get('hashes', []) if h['algo'] == 1), None)
+        file = File(data['fileName'], data['downloadUrl'], data.get('fileLength', 0), sha1, data.get('fileFingerprint'))
+        # relationType 3 is RequiredDependency
+        dependencies = tuple(d['modId'] for d in data.get('dependencies', []) if d.get('relationType') == 3)
+        return cls(
+            'curseforge', data['id'], data['modId'], game_versions,
+            tuple(v.lower() for v in game_versions if v.lower() in CURSEFORGE_LOADERS), (file,), data.get('fileDate', ''),
+            dependencies
+        )
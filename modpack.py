@@ -0,0 +1,221 @@
+import json
+import typing
+import asyncio
+import logging
+import zipfile
+import itertools
+
+import net
+import utils
+import modrinth
+import snapshot
+import curseforge
+
+
+MODRINTH_INDEX = 'modrinth.index.json'
+CURSEFORGE_MANIFEST = 'manifest.json'
+BATCH_SIZE = 100
+SKIPPED = object()  # Entry of a CurseForge pack file that is not a mod
+
+# Dependency names in modrinth.index.json -> mod loader
+MODRINTH_LOADERS = {
+    'fabric-loader': 'fabric',
+    'quilt-loader': 'quilt',
+    'forge': 'forge',
+    'neoforge': 'neoforge'
+}
+
+
+class ModpackError(Exception):
+    """
+    Exception raised when a file is not a supported modpack.
+
+    Attributes:
+        path -- modpack file which caused the error
+        message -- explanation of the error
+    """
+
+    def __init__(self, path, message="File is not a .mrpack or CurseForge modpack"):
+        self.path = path
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"'{self.path}' -> {self.message}"
+
+
+class Modpack:
+    """
+    Mods of an imported modpack. \n
+    mods contains snapshot entries (see snapshot.make_entry) for the exact files pinned by the pack,
+    failed contains the URLs or IDs of the mods that could not be resolved. \n
+    """
+
+    def __init__(self, name: str, game_version: str, mod_loader: str):
+        self.name = name
+        self.game_version = game_version
+        self.mod_loader = mod_loader
+        self.mods: typing.List[dict] = []
+        self.failed: typing.List[str] = []
+
+
+def is_modpack(path: str):
+    return path.endswith(('.mrpack', '.zip', CURSEFORGE_MANIFEST))
+
+
+def read_manifest(path: str):
+    """
+    Returns ('modrinth' or 'curseforge', manifest) for a .mrpack, CurseForge modpack zip or manifest.json. \n
+    The manifest is read straight from the archive, nothing is extracted. \n
+    """
+
+    try:
+        if zipfile.is_zipfile(path):
+            with zipfile.ZipFile(path) as archive:
+                names = set(archive.namelist())
+                for kind, name in (('modrinth', MODRINTH_INDEX), ('curseforge', CURSEFORGE_MANIFEST)):
+                    if name in names:
+                        with archive.open(name) as f:
+                            return kind, json.load(f)
+            raise ModpackError(path)
+
+        with open(path, 'rb') as f:
+            manifest = json.load(f)
+    except (OSError, json.decoder.JSONDecodeError):
+        raise ModpackError(path)
+
+    if 'files' not in manifest:
+        raise ModpackError(path)
+    return ('modrinth' if 'formatVersion' in manifest else 'curseforge'), manifest
+
+
+def _batches(iterable: typing.Iterable, size: int = BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+async def _import_modrinth_batch(files: typing.List[dict]):
+    hashes = [file['hashes']['sha1'] for file in files]
+    versions = await modrinth.get_versions_from_hashes_async(hashes) or {}
+
+    project_ids = list({version.project_id for version in versions.values()})
+    projects = await modrinth.get_projects_async(project_ids) if project_ids else []
+    projects = {project.id: project for project in projects or []}
+
+    entries = []
+    for file, sha1 in zip(files, hashes):
+        version = versions.get(sha1)
+        project = projects.get(version.project_id) if version else None
+        if project is not None:
+            version_file = next((f for f in version.files if f.sha1 == sha1), None)
+            entries.append(snapshot.make_entry(project.slug, project, version, version_file))
+            continue
+
+        # Not a Modrinth file (e.g. hosted on GitHub), the pack still has its download URL
+        if not file.get('downloads'):
+            entries.append(None)
+            continue
+
+        file_name = file['path'].split('/')[-1]
+        entries.append({
+            'provider': 'modrinth',
+            'slug': file_name.removesuffix('.jar'),
+            'project_id': None,
+            'name': file_name,
+            'logo_url': None,
+            'file_id': None,
+            'file_name': file_name,
+            'file_url': file['downloads'][0],
+            'sha1': sha1
+        })
+    return entries
+
+
+async def _import_modrinth(pack: Modpack, manifest: dict, side: str):
+    def is_mod(file):
+        if not file['path'].startswith('mods/'):
+            return False
+        return side is None or file.get('env', {}).get(side) != 'unsupported'
+
+    files = filter(is_mod, manifest['files'])
+    batches = list(_batches(files))
+    async with net.session():
+        results = await asyncio.gather(*(_import_modrinth_batch(batch) for batch in batches))
+    for batch, entries in zip(batches, results):
+        for file, entry in zip(batch, entries):
+            if entry is None:
+                pack.failed.append(file['path'])
+            else:
+                pack.mods.append(entry)
+
+
+async def _import_curseforge_batch(files: typing.List[dict]):
+    mods, mod_files = await asyncio.gather(
+        curseforge.get_mods_async([file['projectID'] for file in files]),
+        curseforge.get_files_async([file['fileID'] for file in files])
+    )
+    mods = {mod.id: mod for mod in mods or []}
+    mod_files = {mod_file.id: mod_file for mod_file in mod_files or []}
+
+    entries = []
+    for file in files:
+        mod = mods.get(file['projectID'])
+        mod_file = mod_files.get(file['fileID'])
+        if mod is not None and mod.class_id not in (None, curseforge.CATEGORY_ID):
+            # Resource packs, shaders, worlds, ... that the pack puts outside of mods
+            entries.append(SKIPPED)
+        elif mod is None or mod_file is None or mod_file.file.url is None:
+            entries.append(None)
+        else:
+            entries.append(snapshot.make_entry(mod.slug, mod, mod_file))
+    return entries, mods
+
+
+async def _import_curseforge(pack: Modpack, manifest: dict):
+    # Optional files are disabled when the pack is installed
+    files = [file for file in manifest['files'] if file.get('required', True)]
+    batches = list(_batches(files))
+    async with net.session():
+        results = await asyncio.gather(*(_import_curseforge_batch(batch) for batch in batches))
+    for batch, (entries, mods) in zip(batches, results):
+        for file, entry in zip(batch, entries):
+            if entry is SKIPPED:
+                continue
+            if entry is not None:
+                pack.mods.append(entry)
+            elif file['projectID'] in mods:
+                pack.failed.append(utils.get_mod_url('curseforge', mods[file['projectID']].slug))
+            else:
+                pack.failed.append(f"CurseForge project {file['projectID']}")
+
+
+def import_modpack(path: str, side: str = None):
+    """
+    Returns the Modpack with the exact files pinned by a .mrpack or CurseForge modpack. \n
+    Mods are resolved by hash or ID with bulk requests, no slug search is needed. \n
+    Side can be 'server' or 'client' to leave out mods that don't support it (.mrpack only). \n
+    Optional files and projects that are not mods, e.g. resource packs, are left out of CurseForge packs. \n
+    Raises ModpackError if the file is not a modpack. \n
+    """
+
+    kind, manifest = read_manifest(path)
+
+    if kind == 'modrinth':
+        dependencies = manifest.get('dependencies', {})
+        mod_loader = next((loader for name, loader in MODRINTH_LOADERS.items() if name in dependencies), 'any')
+        pack = Modpack(manifest.get('name', path), dependencies.get('minecraft', ''), mod_loader)
+        asyncio.run(_import_modrinth(pack, manifest, side))
+    else:
+        if not curseforge.has_api_access():
+            raise ModpackError(path, "CurseForge modpacks can't be imported because API key is not set")
+
+        minecraft = manifest.get('minecraft', {})
+        loaders = minecraft.get('modLoaders', [])
+        primary = next((loader for loader in loaders if loader.get('primary')), loaders[0] if loaders else None)
+        mod_loader = primary['id'].split('-')[0] if primary else 'any'
+        pack = Modpack(manifest.get('name', path), minecraft.get('version', ''), mod_loader)
+        asyncio.run(_import_curseforge(pack, manifest))
+
+    logging.info(f"Imported {len(pack.mods)} mods from '{pack.name}', {len(pack.failed)} failed")
+    return pack
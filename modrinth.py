@@ -1,8 +1,11 @@
 import json
 import typing
-import httpx
 import requests
 
+import net
+import utils
+import models
+
 
 class ModNotFoundException(Exception):
     """
@@ -45,6 +48,29 @@ API_VERSION = 'v2'
 API_URL = f'{API_BASE}/{API_VERSION}'
 
 
+def set_api_url(url: str):
+    """
+    Overrides the API URL, e.g. to use a caching proxy. \n
+    """
+
+    global API_URL
+    API_URL = url.rstrip('/')
+
+
+def select_file(versions: typing.Iterable[models.Version], game_version: str, mod_loader: str = None):
+    """
+    Returns the first (latest) version that matches the game version and mod loader. \n
+    Returns None if no version matches, mod_loader None or 'any' matches all. \n
+    """
+
+    for version in versions:
+        has_game_version = game_version in version.game_versions
+        has_mod_loader = mod_loader in (None, 'any') or mod_loader in version.loaders
+        if has_game_version and has_mod_loader:
+            return version
+    return None
+
+
 def get_mod_from_slug(mod_slug: str):
     """
     Returns the mod given by the slug.
@@ -52,8 +78,8 @@ def get_mod_from_slug(mod_slug: str):
     """
 
     try:
-        result = requests.get(f"{API_URL}/project/{mod_slug}").json()
-        return result
+        result = utils.json_loads(requests.get(f"{API_URL}/project/{mod_slug}").content)
+        return models.Project.from_modrinth(result)
     except json.decoder.JSONDecodeError:
         raise ModNotFoundException(mod_slug)
 
@@ -68,38 +94,16 @@ async def get_mod_from_slug_async(
     Functions are called before and after making a http request. \n
     """
 
-    timeout = httpx.Timeout(30)
-    attempt = 0
-    url = f"{API_URL}/project/{mod_slug}"
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        while True:
-            if attempt >= 3:
-                print(f"Error: Max attempts made for '{mod_slug}'")
-                return
-
-            try:
-                if before_response_funcs is not None:
-                    request_object = client.build_request(method="GET", url=url)
-                    for before_response_func in before_response_funcs:
-                        await before_response_func(request_object)
-
-                response = await client.get(url)
-
-                mod = None
-                if response.status_code == 200:
-                    mod = response.json()
+    response = await net.get(f"{API_URL}/project/{mod_slug}", f"'{mod_slug}'", before_response_funcs)
+    if response is None:
+        return
 
-                if after_response_funcs is not None:
-                    for response_func in after_response_funcs:
-                        await response_func(response, mod)
+    mod = None
+    if response.status_code == 200:
+        mod = models.Project.from_modrinth(utils.json_loads(response.content))
 
-                return mod
-            except httpx.ReadTimeout:
-                attempt += 1
-                print(f"Error: httpx.ReadTimeout for '{mod_slug}', trying again ({attempt})")
-            except httpx.ConnectTimeout:
-                attempt += 1
-                print(f"Error: httpx.ConnectTimeout for '{mod_slug}', trying again ({attempt})")
+    await net.call_after_response_funcs(after_response_funcs, response, mod)
+    return mod
 
 
 def get_latest_mod_file(mod_slug: str, game_version: str, mod_loader: str = None):
@@ -110,15 +114,14 @@ def get_latest_mod_file(mod_slug: str, game_version: str, mod_loader: str = None
     """
 
     try:
-        mods = requests.get(f"{API_URL}/project/{mod_slug}/version").json()
+        mods = utils.json_loads(requests.get(f"{API_URL}/project/{mod_slug}/version").content)
     except json.decoder.JSONDecodeError:
         raise ModNotFoundException(mod_slug)
 
-    for mod in mods:
-        has_game_version = game_version in mod['game_versions']
-        has_mod_loader = True if mod_loader is None else mod_loader in mod['loaders']
-        if has_game_version and has_mod_loader:
-            return mod
+    # Models are only made up to the first matching version
+    mod = select_file(map(models.Version.from_modrinth, mods), game_version, mod_loader)
+    if mod is not None:
+        return mod
 
     # If correct game version is not found, raise error
     raise ModVersionNotFoundException(game_version)
@@ -129,44 +132,85 @@ async def get_latest_mod_file_async(
         before_response_funcs: typing.List[typing.Callable] = None,
         after_response_funcs: typing.List[typing.Callable] = None):
     """
-    Returns the latest file that matches the params. \n
+    Returns the latest file that matches the params, mod_slug can also be the project ID. \n
     Returns None if no mod or file was found. \n
     Functions are called before and after making a http request. \n
     """
 
-    timeout = httpx.Timeout(30)
-    attempt = 0
     url = f"{API_URL}/project/{mod_slug}/version"
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        while True:
-            if attempt >= 3:
-                print(f"Error: Max attempts made for '{mod_slug}'")
-                return
-
-            try:
-                if before_response_funcs is not None:
-                    request_object = client.build_request(method="GET", url=url)
-                    for before_response_func in before_response_funcs:
-                        await before_response_func(request_object)
-
-                response = await client.get(url)
-
-                correct_file = None
-                if response.status_code == 200:
-                    for file in response.json():
-                        has_game_version = game_version in file['game_versions']
-                        has_mod_loader = True if mod_loader is None else mod_loader in file['loaders']
-                        if has_game_version and has_mod_loader:
-                            correct_file = file
-
-                if after_response_funcs is not None:
-                    for response_func in after_response_funcs:
-                        await response_func(response, correct_file)
-
-                return correct_file
-            except httpx.ReadTimeout:
-                attempt += 1
-                print(f"Error: httpx.ReadTimeout for '{mod_slug}', trying again ({attempt})")
-            except httpx.ConnectTimeout:
-                attempt += 1
-                print(f"Error: httpx.ConnectTimeout for '{mod_slug}', trying again ({attempt})")
+    response = await net.get(url, f"'{mod_slug}'", before_response_funcs)
+    if response is None:
+        return
+
+    correct_file = None
+    if response.status_code == 200:
+        versions = map(models.Version.from_modrinth, utils.json_loads(response.content))
+        correct_file = select_file(versions, game_version, mod_loader)
+
+    await net.call_after_response_funcs(after_response_funcs, response, correct_file)
+    return correct_file
+
+
+async def get_mod_versions_async(mod_slug: str):
+    """
+    Returns all versions of the mod, newest first, for every game version and mod loader. \n
+    mod_slug can also be the project ID. \n
+    Returns None if the versions could not be fetched. \n
+    """
+
+    response = await net.get(f"{API_URL}/project/{mod_slug}/version", f"'{mod_slug}'")
+    if response is None or response.status_code != 200:
+        return
+    return [models.Version.from_modrinth(version) for version in utils.json_loads(response.content)]
+
+
+async def search_mods_async(offset: int = 0, limit: int = 100, index: str = 'updated', query: str = None):
+    """
+    Returns a page of search results for mods, sorted by index. \n
+    Returns None if the page could not be fetched. \n
+    """
+
+    params = {
+        'facets': json.dumps([["project_type:mod"]]),
+        'index': index,
+        'offset': offset,
+        'limit': limit
+    }
+    if query:
+        params['query'] = query
+
+    response = await net.get(f"{API_URL}/search", f"search page {offset}", params=params)
+    if response is None or response.status_code != 200:
+        return
+    return utils.json_loads(response.content)
+
+
+async def get_versions_from_hashes_async(hashes: typing.List[str], algorithm: str = 'sha1'):
+    """
+    Returns a dict of file hash -> version for all files in one request. \n
+    Hashes that are not known to Modrinth are left out, returns None if the request failed. \n
+    """
+
+    response = await net.post(
+        f"{API_URL}/version_files", f"{len(hashes)} hashes",
+        json={'hashes': hashes, 'algorithm': algorithm}
+    )
+    if response is None or response.status_code != 200:
+        return
+    versions = utils.json_loads(response.content)
+    return {file_hash: models.Version.from_modrinth(version) for file_hash, version in versions.items()}
+
+
+async def get_projects_async(project_ids: typing.List[str]):
+    """
+    Returns the projects with the given IDs or slugs in one request. \n
+    Returns None if the request failed. \n
+    """
+
+    response = await net.get(
+        f"{API_URL}/projects", f"{len(project_ids)} projects",
+        params={'ids': json.dumps(project_ids)}
+    )
+    if response is None or response.status_code != 200:
+        return
+    return [models.Project.from_modrinth(project) for project in utils.json_loads(response.content)]
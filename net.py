@@ -0,0 +1,186 @@
+import typing
+import contextvars
+import contextlib
+import collections
+import httpx
+
+import hedge
+
+
+TIMEOUT = httpx.Timeout(30)
+MAX_ATTEMPTS = 3
+MAX_VALIDATORS = 256
+
+_client: contextvars.ContextVar[typing.Optional[httpx.AsyncClient]] = contextvars.ContextVar('client', default=None)
+
+
+class ValidatorCache:
+    """
+    Remembers the last response of GET requests that came with an ETag or Last-Modified header,
+    so the next request for the same URL can be conditional and a 304 costs no response body. \n
+    Only the most recent max_entries URLs are kept. \n
+    """
+
+    def __init__(self, max_entries: int = MAX_VALIDATORS):
+        self.max_entries = max_entries
+        self.not_modified = 0
+        self._responses: collections.OrderedDict[str, httpx.Response] = collections.OrderedDict()
+
+    def headers(self, key: str):
+        response = self._responses.get(key)
+        if response is None:
+            return {}
+
+        headers = {}
+        if 'etag' in response.headers:
+            headers['If-None-Match'] = response.headers['etag']
+        if 'last-modified' in response.headers:
+            headers['If-Modified-Since'] = response.headers['last-modified']
+        return headers
+
+    def update(self, key: str, response: httpx.Response):
+        """
+        Returns the remembered response if the server answered 304, otherwise remembers and returns response. \n
+        """
+
+        if response.status_code == 304 and key in self._responses:
+            self.not_modified += 1
+            self._responses.move_to_end(key)
+            return self._responses[key]
+
+        if response.status_code == 200 and ('etag' in response.headers or 'last-modified' in response.headers):
+            self._responses[key] = response
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+        return response
+
+
+# Kinds of failed requests, see track_failures
+FAILURE_RATE_LIMITED = 'rate_limited'
+FAILURE_TIMEOUT = 'timeout'
+FAILURE_SERVER_ERROR = 'server_error'
+
+_failures: contextvars.ContextVar[typing.Optional[typing.Set[str]]] = contextvars.ContextVar('failures', default=None)
+
+
+@contextlib.contextmanager
+def track_failures():
+    """
+    Collects the kinds of failures (FAILURE_RATE_LIMITED, FAILURE_TIMEOUT, FAILURE_SERVER_ERROR) of all requests
+    made inside the block, including requests of tasks started inside it, so a caller that only gets None back
+    can tell why. \n
+    """
+
+    failures = set()
+    token = _failures.set(failures)
+    try:
+        yield failures
+    finally:
+        _failures.reset(token)
+
+
+def _record_failure(kind: str):
+    failures = _failures.get()
+    if failures is not None:
+        failures.add(kind)
+
+
+_validators: contextvars.ContextVar[typing.Optional[ValidatorCache]] = contextvars.ContextVar('validators', default=None)
+
+
+@contextlib.contextmanager
+def conditional(cache: ValidatorCache):
+    """
+    Makes all GET requests inside the block conditional, using and updating cache. \n
+    """
+
+    token = _validators.set(cache)
+    try:
+        yield cache
+    finally:
+        _validators.reset(token)
+
+
+@contextlib.asynccontextmanager
+async def session():
+    """
+    Shares one client, and so its connections, between all requests made inside the block,
+    including requests made by tasks started inside it. \n
+    """
+
+    async with httpx.AsyncClient(timeout=TIMEOUT, follow_redirects=True) as client:
+        token = _client.set(client)
+        try:
+            yield client
+        finally:
+            _client.reset(token)
+
+
+@contextlib.asynccontextmanager
+async def _get_client():
+    client = _client.get()
+    if client is not None:
+        yield client
+        return
+
+    async with httpx.AsyncClient(timeout=TIMEOUT, follow_redirects=True) as client:
+        yield client
+
+
+async def request(
+        method: str, url: str, name: str,
+        before_response_funcs: typing.List[typing.Callable] = None, **kwargs):
+    """
+    Makes a request, trying again on timeouts, and returns the response. \n
+    Returns None if all attempts timed out, name is used in the error messages. \n
+    GET requests are hedged, see hedge.get, and conditional inside a conditional block. \n
+    Functions in before_response_funcs are called with the request before it is sent. \n
+    """
+
+    validators = _validators.get() if method == 'GET' else None
+    if validators is not None:
+        key = str(httpx.URL(url, params=kwargs.get('params')))
+        kwargs['headers'] = {**(kwargs.get('headers') or {}), **validators.headers(key)}
+
+    async with _get_client() as client:
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                if before_response_funcs is not None:
+                    request_object = client.build_request(method=method, url=url, **kwargs)
+                    for before_response_func in before_response_funcs:
+                        await before_response_func(request_object)
+
+                if method != 'GET':
+                    response = await client.request(method, url, **kwargs)
+                else:
+                    response = await hedge.get(client, url, **kwargs)
+                    if validators is not None:
+                        response = validators.update(key, response)
+
+                if response.status_code == 429:
+                    _record_failure(FAILURE_RATE_LIMITED)
+                elif response.status_code >= 500:
+                    _record_failure(FAILURE_SERVER_ERROR)
+                return response
+            except (httpx.ReadTimeout, httpx.ConnectTimeout) as e:
+                print(f"Error: httpx.{type(e).__name__} for {name}, trying again ({attempt + 1})")
+
+    print(f"Error: Max attempts made for {name}")
+    _record_failure(FAILURE_TIMEOUT)
+    return None
+
+
+async def get(url: str, name: str, before_response_funcs: typing.List[typing.Callable] = None, **kwargs):
+    return await request('GET', url, name, before_response_funcs, **kwargs)
+
+
+async def post(url: str, name: str, before_response_funcs: typing.List[typing.Callable] = None, **kwargs):
+    return await request('POST', url, name, before_response_funcs, **kwargs)
+
+
+async def call_after_response_funcs(
+        after_response_funcs: typing.Optional[typing.List[typing.Callable]], response: httpx.Response, result):
+    if after_response_funcs is not None:
+        for response_func in after_response_funcs:
+            await response_func(response, result)
@@ -0,0 +1,327 @@
+import io
+import os
+import json
+import time
+import shutil
+import typing
+import hashlib
+import logging
+import tarfile
+import zipfile
+
+import utils
+import install
+
+try:
+    # Optional, needed for .tar.zst packs
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+PACK_FORMAT = 1
+LOCK_NAME = 'pack.lock.json'
+MODS_DIR = 'mods'
+CONFIG_DIR = 'config'
+FORMATS = ('.zip', '.tar.zst')
+ZSTD_LEVEL = 10
+WORKERS = os.cpu_count() or 1
+COPY_BUFFER = 1024 * 1024
+PENDING_SUFFIX = ".pack"
+LOCK_MOD_KEYS = ('provider', 'slug', 'project_id', 'name', 'file_name', 'file_url', 'sha1')
+
+
+class PackError(Exception):
+    """
+    Exception raised when a server pack can not be built, read or applied.
+
+    Attributes:
+        path -- pack or folder which caused the error
+        message -- explanation of the error
+    """
+
+    def __init__(self, path, message="Server pack is not valid"):
+        self.path = path
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"'{self.path}' -> {self.message}"
+
+
+def _format(path: str):
+    for extension in FORMATS:
+        if path.endswith(extension):
+            if extension == '.tar.zst' and zstandard is None:
+                raise PackError(path, "Packs in .tar.zst need the zstandard package, 'pip install zstandard'")
+            return extension
+    raise PackError(path, f"Packs have to end in {' or '.join(FORMATS)}")
+
+
+def _collect(mods_folder: str, config_folder: str = None):
+    """
+    Returns archive name -> path of the jars in mods_folder and everything in config_folder. \n
+    """
+
+    files = {
+        f"{MODS_DIR}/{name}": os.path.join(mods_folder, name)
+        for name in os.listdir(mods_folder) if name.endswith('.jar')
+    }
+    if config_folder:
+        for root, _, names in os.walk(config_folder):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, config_folder).replace(os.sep, '/')
+                files[f"{CONFIG_DIR}/{relative}"] = path
+    return dict(sorted(files.items()))
+
+
+def mod_entries(entries: typing.Iterable[dict], mods_folder: str):
+    """
+    Returns the metadata for the lockfile of the result store entries (see results.ResultStore)
+    whose jars are in mods_folder. \n
+    """
+
+    jars = {name for name in os.listdir(mods_folder) if name.endswith('.jar')}
+    return [
+        {key: entry.get(key) for key in LOCK_MOD_KEYS}
+        for entry in entries if entry.get('file_name') in jars
+    ]
+
+
+def _pack_id(files: typing.Dict[str, dict]):
+    digest = hashlib.sha1()
+    for name, info in sorted(files.items()):
+        digest.update(f"{name}\0{info['sha1']}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def read_lock(path: str):
+    """
+    Returns the lockfile of a pack, path can be the pack or a lockfile. \n
+    Raises PackError if it can't be read. \n
+    """
+
+    try:
+        if path.endswith('.json'):
+            with open(path) as f:
+                lock = json.load(f)
+        elif _format(path) == '.zip':
+            with zipfile.ZipFile(path) as archive:
+                lock = json.loads(archive.read(LOCK_NAME))
+        else:
+            # The lockfile is the first member, so only the start of the stream is decompressed
+            with open(path, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as stream:
+                with tarfile.open(fileobj=stream, mode='r|') as archive:
+                    member = archive.next()
+                    if member is None or member.name != LOCK_NAME:
+                        raise KeyError(LOCK_NAME)
+                    lock = json.load(archive.extractfile(member))
+    except (OSError, KeyError, zipfile.BadZipFile, tarfile.TarError, json.decoder.JSONDecodeError):
+        raise PackError(path, "Pack has no readable lockfile")
+
+    if lock.get('format') != PACK_FORMAT:
+        raise PackError(path, f"Pack format {lock.get('format')} is not supported")
+    return lock
+
+
+def _write_zip(path: str, lock_data: bytes, members: typing.Dict[str, str]):
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(LOCK_NAME, lock_data)
+        for name, src in members.items():
+            # Jars are already zips, compressing them again only costs time
+            archive.write(src, name, compress_type=zipfile.ZIP_STORED if name.endswith('.jar') else None)
+
+
+def _write_tar_zst(path: str, lock_data: bytes, members: typing.Dict[str, str], workers: int):
+    # zstd splits the stream into jobs that are compressed by a pool of workers, and stores incompressible
+    # blocks such as the inside of jars raw, so those only cost a quick check
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=workers)
+    with open(path, 'wb') as f, compressor.stream_writer(f) as stream:
+        with tarfile.open(fileobj=stream, mode='w|') as archive:
+            info = tarfile.TarInfo(LOCK_NAME)
+            info.size = len(lock_data)
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(lock_data))
+            for name, src in members.items():
+                archive.add(src, name, recursive=False)
+
+
+def build_pack(
+        mods_folder: str, output: str, config_folder: str = None, base: str = None,
+        game_version: str = "", mod_loader: str = "", mods: typing.List[dict] = None, workers: int = WORKERS):
+    """
+    Writes a server pack (.zip or .tar.zst) with the jars of mods_folder, the files of config_folder
+    and a lockfile that lists every file with its sha1 and the mod metadata in mods. \n
+    Files with the same content are only stored once. With base, a previous pack or its lockfile,
+    a delta pack is written that only contains files whose content is not in the base, apply_pack
+    takes the rest from the installed base pack. \n
+    Returns the lockfile. \n
+    """
+
+    fmt = _format(output)
+    if not os.path.isdir(mods_folder):
+        raise PackError(mods_folder, "Mods folder does not exist")
+
+    files = _collect(mods_folder, config_folder)
+    digests = utils.hash_files(files.values(), algorithms=('sha1',), workers=workers)
+    lock_files = {
+        name: {'sha1': digests[os.path.abspath(path)]['sha1'], 'size': os.path.getsize(path)}
+        for name, path in files.items()
+    }
+
+    base_lock = read_lock(base) if base else None
+    stored = {info['sha1'] for info in base_lock['files'].values()} if base_lock else set()
+    members = {}
+    for name, info in lock_files.items():
+        if info['sha1'] not in stored:
+            stored.add(info['sha1'])
+            members[name] = files[name]
+
+    lock = {
+        'format': PACK_FORMAT,
+        'id': _pack_id(lock_files),
+        'base': base_lock['id'] if base_lock else None,
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+        'game_version': game_version,
+        'mod_loader': mod_loader,
+        'files': lock_files,
+        'mods': mods or []
+    }
+    lock_data = json.dumps(lock, indent=4).encode()
+
+    tmp = f"{output}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    try:
+        if fmt == '.zip':
+            _write_zip(tmp, lock_data, members)
+        else:
+            _write_tar_zst(tmp, lock_data, members, workers)
+        os.replace(tmp, output)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    kind = f"Delta pack on '{lock['base']}'" if base_lock else "Pack"
+    logging.info(f"{kind} '{lock['id']}' written to '{output}' ({os.path.getsize(output) / 1024:.0f} KiB), "
+                 f"{len(members)} of {len(lock_files)} files stored")
+    return lock
+
+
+def _members(path: str):
+    """
+    Yields (archive name, file object) for every file in the pack, in archive order. \n
+    """
+
+    if _format(path) == '.zip':
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as src:
+                        yield info.filename, src
+        return
+
+    with open(path, 'rb') as f, zstandard.ZstdDecompressor().stream_reader(f) as stream:
+        with tarfile.open(fileobj=stream, mode='r|') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member)
+
+
+def _destination(directory: str, staging_folder: str, name: str):
+    if name.startswith(f"{MODS_DIR}/") and name.count('/') == 1:
+        return os.path.join(staging_folder, name.split('/', 1)[1])
+
+    path = os.path.normpath(os.path.join(directory, name))
+    if not name.startswith(f"{CONFIG_DIR}/") or not path.startswith(os.path.abspath(directory) + os.sep):
+        raise PackError(name, "Pack contains a file outside of mods and config")
+    return path
+
+
+def _link_or_copy(src: str, dst: str):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def apply_pack(path: str, directory: str, backup: bool = False):
+    """
+    Installs a pack into a server directory: the mods folder is replaced with a staged install
+    (see install.StagedInstall, so 'rollback' works), config files are written in place and files that
+    the installed pack had but this one hasn't are removed. \n
+    A delta pack can only be applied on top of its base pack. \n
+    Returns the lockfile of the pack. \n
+    """
+
+    directory = os.path.abspath(directory)
+    lock = read_lock(path)
+    current_location = os.path.join(directory, LOCK_NAME)
+    current = read_lock(current_location) if os.path.exists(current_location) else None
+    if lock['base'] and (current is None or current['id'] != lock['base']):
+        installed = current['id'] if current else "no pack"
+        raise PackError(path, f"Delta pack is for pack '{lock['base']}', but '{installed}' is installed")
+
+    # Where the content of each file can be found on disk, for files the pack doesn't store itself
+    by_sha1 = {}
+    if current is not None:
+        for name, info in current['files'].items():
+            by_sha1.setdefault(info['sha1'], os.path.join(directory, name))
+
+    # Config files are written next to their destination and only renamed once the mods are swapped in
+    staged = install.StagedInstall(os.path.join(directory, MODS_DIR))
+    written = {}
+    by_content = {}
+    try:
+        for name, src in _members(path):
+            if name == LOCK_NAME:
+                continue
+            if name not in lock['files']:
+                raise PackError(name, "File is not in the lockfile")
+            destination = _destination(directory, staged.staging_folder, name)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with open(destination + PENDING_SUFFIX, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_BUFFER)
+            written[name] = destination
+            by_content.setdefault(lock['files'][name]['sha1'], destination + PENDING_SUFFIX)
+
+        for name, info in lock['files'].items():
+            if name in written:
+                continue
+            src = by_content.get(info['sha1']) or by_sha1.get(info['sha1'])
+            if src is None or not os.path.isfile(src):
+                raise PackError(name, "File is neither in the pack nor installed")
+            destination = _destination(directory, staged.staging_folder, name)
+            _link_or_copy(src, destination + PENDING_SUFFIX)
+            written[name] = destination
+
+        for name, destination in written.items():
+            if name.startswith(f"{MODS_DIR}/"):
+                os.replace(destination + PENDING_SUFFIX, destination)
+                staged.add(destination, lock['files'][name]['sha1'])
+        staged.commit(backup=backup)
+    except (PackError, install.InstallError, OSError):
+        staged.abort()
+        for name, destination in written.items():
+            if os.path.exists(destination + PENDING_SUFFIX):
+                os.remove(destination + PENDING_SUFFIX)
+        raise
+
+    for name, destination in written.items():
+        if name.startswith(f"{CONFIG_DIR}/"):
+            os.replace(destination + PENDING_SUFFIX, destination)
+
+    if current is not None:
+        for name in current['files']:
+            if name.startswith(f"{CONFIG_DIR}/") and name not in lock['files']:
+                stale = os.path.join(directory, name)
+                if os.path.isfile(stale):
+                    os.remove(stale)
+
+    with open(f"{current_location}.tmp", 'w') as f:
+        json.dump(lock, f, indent=4)
+    os.replace(f"{current_location}.tmp", current_location)
+    logging.info(f"Applied pack '{lock['id']}' to '{directory}'")
+    return lock
@@ -0,0 +1,476 @@
+import typing
+import asyncio
+import logging
+import threading
+import collections
+
+import net
+import utils
+import models
+import downloads
+import providers
+import project_index
+
+
+# Concurrent workers per stage
+STAGE_LIMITS = {
+    'lookup': 4,
+    'files': 16,
+    'enrich': 16
+}
+QUEUE_SIZE = 256
+MAX_BATCH = 100
+
+# Why a mod could not be resolved, see Result.reason
+NOT_SUPPORTED = 'not_supported'
+NO_API_KEY = 'no_api_key'
+NOT_FOUND = 'not_found'
+NO_COMPATIBLE_FILE = 'no_compatible_file'
+RATE_LIMITED = 'rate_limited'
+TIMEOUT = 'timeout'
+ERROR = 'error'
+
+
+def _classify(failures: typing.Set[str], default: str):
+    """
+    Returns the reason for an empty answer, based on the failed requests made while getting it. \n
+    """
+
+    if net.FAILURE_RATE_LIMITED in failures:
+        return RATE_LIMITED
+    if net.FAILURE_TIMEOUT in failures:
+        return TIMEOUT
+    if net.FAILURE_SERVER_ERROR in failures:
+        return ERROR
+    return default
+
+
+_END_OF_INPUT = object()
+
+
+class Result:
+    """
+    Outcome of resolving one mod URL. \n
+    If error is set, project and/or version are None and reason is one of the reasons above. \n
+    """
+
+    __slots__ = ('url', 'slug', 'provider', 'project', 'version', 'icon', 'error', 'reason', 'fallback', 'indexed')
+
+    def __init__(self, url: str, provider: providers.Provider = None):
+        self.url = url
+        self.slug = utils.get_slug_from_url(url)
+        self.provider = provider
+        self.project: typing.Optional[models.Project] = None
+        self.version: typing.Optional[models.Version] = None
+        self.icon: typing.Optional[bytes] = None
+        self.error: typing.Optional[str] = None
+        self.reason: typing.Optional[str] = None
+        self.fallback = False  # True if the file comes from another provider than the URL
+        self.indexed = False  # True if the project comes from the project index, not a lookup
+
+    def fail(self, reason: str, error: str):
+        self.reason = reason
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def file_url(self):
+        return self.provider.download_url(self.version)
+
+    @property
+    def file_name(self):
+        return self.version.file.file_name
+
+    def download(self):
+        return downloads.Download(
+            self.file_url, self.file_name, self.version.file.size, self.version.file.sha1,
+            project_id=self.project.id, dependencies=self.version.dependencies
+        )
+
+
+class Pipeline:
+    """
+    Resolves mod URLs in stages: parse -> dedupe -> batch lookup -> file selection -> enrich -> emit. \n
+    Every stage has its own number of workers (see STAGE_LIMITS) and bounded queues between the stages,
+    so each result is emitted as soon as it is ready. \n
+    With fallback, the file is looked for on every available provider at the same time and the first acceptable
+    match in order of preference (provider names, the provider of the URL first if empty) is used. \n
+    """
+
+    def __init__(
+            self, game_version: str, mod_loader: str,
+            on_result: typing.Callable[[Result], None] = None,
+            limits: typing.Dict[str, int] = None, fetch_icons: bool = False,
+            fallback: bool = False, preference: typing.List[str] = None, keep_results: bool = True,
+            index: project_index.ProjectIndex = None):
+        self.game_version = game_version
+        self.mod_loader = mod_loader
+        self.on_result = on_result
+        self.limits = {**STAGE_LIMITS, **(limits or {})}
+        self.fetch_icons = fetch_icons
+        self.fallback = fallback
+        self.preference = preference or []
+        self.keep_results = keep_results
+        self.index = index
+        self.results: typing.List[Result] = []
+
+        self._lookup_queue: asyncio.Queue = None
+        self._files_queue: asyncio.Queue = None
+        self._enrich_queue: asyncio.Queue = None
+
+    def _emit(self, result: Result):
+        if result.ok:
+            logging.info(f"Found file for '{result.slug}'")
+        else:
+            logging.error(f"'{result.url}' -> {result.error}")
+
+        if self.keep_results:
+            self.results.append(result)
+        if self.on_result is not None:
+            self.on_result(result)
+
+    async def _read(self, urls: typing.Iterable[str]):
+        """
+        Yields the URLs. Unless they are already in memory, they are read in a thread through a bounded queue,
+        so a slow source like stdin never blocks the workers and long lists are never read ahead far. \n
+        """
+
+        if isinstance(urls, (list, tuple)):
+            for url in urls:
+                yield url
+            return
+
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+        room = threading.Semaphore(QUEUE_SIZE)  # Bounds the queue without a round trip to the loop per line
+        stopped = threading.Event()
+
+        def read():
+            end = _END_OF_INPUT
+            try:
+                for url in urls:
+                    while not room.acquire(timeout=1):
+                        if stopped.is_set():
+                            return
+                    loop.call_soon_threadsafe(lines.put_nowait, url)
+            except Exception as e:
+                if loop.is_closed():
+                    # The pipeline was stopped, nobody waits for the rest
+                    return
+                end = e
+            try:
+                loop.call_soon_threadsafe(lines.put_nowait, end)
+            except RuntimeError:
+                pass
+
+        threading.Thread(target=read, name="pipeline-input", daemon=True).start()
+        try:
+            while True:
+                url = await lines.get()
+                room.release()
+                if url is _END_OF_INPUT:
+                    return
+                if isinstance(url, Exception):
+                    raise url
+                yield url
+        finally:
+            stopped.set()
+
+    def _parse(self, url: str, seen: typing.Set[typing.Tuple[str, str]]):
+        """
+        Returns a Result for a new mod URL, None for mods that were already listed, so they are only resolved once. \n
+        Only the provider and slug of every mod are kept to find duplicates. \n
+        """
+
+        provider = providers.get_provider(url)
+        result = Result(url, provider)
+        if provider is None:
+            result.fail(NOT_SUPPORTED, "URL is not supported")
+        elif not result.slug:
+            result.fail(NOT_SUPPORTED, "URL has no mod in it")
+        elif not provider.is_available():
+            result.fail(NO_API_KEY, "API key is not set")
+        elif (provider.name, result.slug) in seen:
+            return None
+        else:
+            seen.add((provider.name, result.slug))
+            logging.info(f"Looking for '{result.slug}' using {provider.display_name}")
+        return result
+
+    async def _lookup_chunk(self, provider: providers.Provider, chunk: typing.List[Result]):
+        try:
+            with net.track_failures() as failures:
+                projects = await provider.lookup_many([result.slug for result in chunk])
+        except Exception as e:
+            logging.exception(e)
+            for result in chunk:
+                result.fail(ERROR, f"Lookup failed ({e})")
+                self._emit(result)
+            return
+
+        for result in chunk:
+            result.project = projects.get(result.slug)
+            if result.project is None:
+                # Failures are tracked per chunk, a real miss in a chunk with a timeout
+                # is reported as a timeout too, so retrying failed mods still covers it
+                reason = _classify(failures, NOT_FOUND)
+                result.fail(reason, "Mod was not found" if reason == NOT_FOUND else
+                            f"Lookup failed ({reason.replace('_', ' ')})")
+                if self.fallback:
+                    await self._files_queue.put(result)
+                else:
+                    self._emit(result)
+            else:
+                if self.index is not None:
+                    self.index.put(result.slug, result.project)
+                await self._files_queue.put(result)
+
+    async def _lookup_worker(self):
+        while True:
+            batch = [await self._lookup_queue.get()]
+            while len(batch) < MAX_BATCH and not self._lookup_queue.empty():
+                batch.append(self._lookup_queue.get_nowait())
+
+            try:
+                by_provider = collections.defaultdict(list)
+                for result in batch:
+                    by_provider[result.provider.name].append(result)
+
+                # All chunks of the batch at once, for providers without a batch endpoint every chunk is one mod
+                await asyncio.gather(*(
+                    self._lookup_chunk(providers.PROVIDERS[name], results[i:i + providers.PROVIDERS[name].batch_size])
+                    for name, results in by_provider.items()
+                    for i in range(0, len(results), providers.PROVIDERS[name].batch_size)
+                ))
+            except Exception as e:
+                logging.exception(e)
+                for result in batch:
+                    if result.project is None and result.error is None:
+                        result.fail(ERROR, f"Lookup failed ({e})")
+                        self._emit(result)
+            finally:
+                for _ in batch:
+                    self._lookup_queue.task_done()
+
+    def _providers_by_preference(self, result: Result):
+        order = [providers.PROVIDERS[name] for name in self.preference if name in providers.PROVIDERS]
+        if not order:
+            order = [result.provider]
+        order += [provider for provider in providers.PROVIDERS.values() if provider not in order]
+
+        # The provider of the URL can only be used if its project was found
+        return [
+            provider for provider in order
+            if (provider is result.provider and result.project is not None)
+            or (provider is not result.provider and provider.is_available())
+        ]
+
+    async def _resolve_on(self, provider: providers.Provider, result: Result):
+        """
+        Returns (project, version) of the mod on provider, or None. \n
+        """
+
+        if provider is result.provider:
+            project = result.project
+        else:
+            name = result.project.name if result.project is not None else None
+            project = await provider.find_counterpart(result.slug, name)
+        if project is None:
+            return None
+
+        version = await provider.get_latest_file(project, self.game_version, self.mod_loader)
+        if version is None or provider.download_url(version) is None:
+            return None
+        return project, version
+
+    async def _race(self, result: Result):
+        """
+        Looks for the mod on all providers concurrently and returns (provider, project, version) of the most
+        preferred provider that has a compatible file, or None. \n
+        Waiting on the preferred provider adds no latency, and the others are cancelled as soon as it wins. \n
+        """
+
+        candidates = self._providers_by_preference(result)
+        tasks = [asyncio.ensure_future(self._resolve_on(provider, result)) for provider in candidates]
+        try:
+            for provider, task in zip(candidates, tasks):
+                try:
+                    found = await task
+                except Exception as e:
+                    logging.warning(f"Couldn't look for '{result.slug}' on {provider.display_name} ({e})")
+                    continue
+                if found is not None:
+                    return (provider, *found)
+            return None
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _files_worker(self):
+        while True:
+            result = await self._files_queue.get()
+            try:
+                if self.fallback:
+                    await self._select_with_fallback(result)
+                    continue
+
+                with net.track_failures() as failures:
+                    result.version = await result.provider.get_latest_file(
+                        result.project, self.game_version, self.mod_loader
+                    )
+                    if result.version is None and result.indexed:
+                        await self._revalidate(result)
+                if result.version is None or result.provider.download_url(result.version) is None:
+                    reason = _classify(failures, NO_COMPATIBLE_FILE)
+                    result.fail(reason, "No compatible file was found" if reason == NO_COMPATIBLE_FILE else
+                                f"File selection failed ({reason.replace('_', ' ')})")
+                    self._emit(result)
+                else:
+                    await self._enrich_queue.put(result)
+            except Exception as e:
+                logging.exception(e)
+                result.fail(ERROR, f"File selection failed ({e})")
+                self._emit(result)
+            finally:
+                self._files_queue.task_done()
+
+    async def _revalidate(self, result: Result):
+        """
+        Looks the slug of an indexed project up again after no file was found for it,
+        in case the project was deleted or the slug now belongs to another one. \n
+        """
+
+        indexed = result.project
+        self.index.forget(result.provider.name, result.slug)
+        result.indexed = False
+        result.project = (await result.provider.lookup_many([result.slug])).get(result.slug)
+        if result.project is None:
+            result.project = indexed
+            return
+
+        self.index.put(result.slug, result.project)
+        if result.project.id != indexed.id:
+            result.version = await result.provider.get_latest_file(result.project, self.game_version, self.mod_loader)
+
+    async def _select_with_fallback(self, result: Result):
+        with net.track_failures() as failures:
+            found = await self._race(result)
+
+        if found is None:
+            # A failed lookup keeps its reason, otherwise no provider had a compatible file
+            if result.ok:
+                reason = _classify(failures, NO_COMPATIBLE_FILE)
+                result.fail(reason, "No compatible file was found" if reason == NO_COMPATIBLE_FILE else
+                            f"File selection failed ({reason.replace('_', ' ')})")
+            self._emit(result)
+            return
+
+        provider, result.project, result.version = found
+        result.fallback = provider is not result.provider
+        if result.fallback:
+            logging.info(f"Using {provider.display_name} for '{result.slug}'")
+        result.provider = provider
+        result.error = result.reason = None
+        await self._enrich_queue.put(result)
+
+    async def _enrich_worker(self):
+        while True:
+            result = await self._enrich_queue.get()
+            try:
+                if self.fetch_icons and result.project.icon_url:
+                    response = await net.get(utils.proxied_url(result.project.icon_url), f"icon of '{result.slug}'")
+                    if response is not None and response.status_code == 200:
+                        result.icon = response.content
+            except Exception as e:
+                logging.warning(f"Couldn't fetch icon of '{result.slug}' ({e})")
+            finally:
+                self._emit(result)
+                self._enrich_queue.task_done()
+
+    async def run(self, urls: typing.Iterable[str]):
+        """
+        Resolves all URLs and returns the results, in the order they finished. \n
+        urls can be any iterable, e.g. utils.read_urls, it is consumed as the stages have room for more. \n
+        """
+
+        self._lookup_queue = asyncio.Queue(QUEUE_SIZE)
+        self._files_queue = asyncio.Queue(QUEUE_SIZE)
+        self._enrich_queue = asyncio.Queue(QUEUE_SIZE)
+
+        async with net.session():
+            workers = [
+                asyncio.ensure_future(worker())
+                for worker, limit in (
+                    (self._lookup_worker, self.limits['lookup']),
+                    (self._files_worker, self.limits['files']),
+                    (self._enrich_worker, self.limits['enrich'])
+                )
+                for _ in range(limit)
+            ]
+
+            try:
+                seen = set()
+                async for url in self._read(urls):
+                    result = self._parse(url, seen)
+                    if result is None:
+                        continue
+                    if result.ok and self.index is not None:
+                        result.project = self.index.get(result.provider.name, result.slug)
+                        result.indexed = result.project is not None
+                    if result.indexed:
+                        # Known project ID, no lookup needed
+                        await self._files_queue.put(result)
+                    elif result.ok:
+                        await self._lookup_queue.put(result)
+                    elif self.fallback and result.reason == NO_API_KEY:
+                        # Can't be looked up on its own provider, but maybe on another
+                        await self._files_queue.put(result)
+                    else:
+                        self._emit(result)
+
+                # Items only move forward, so the stages are done once the queues are joined in order
+                await self._lookup_queue.join()
+                await self._files_queue.join()
+                await self._enrich_queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+                if self.index is not None:
+                    self.index.save()
+
+        return self.results
+
+
+def resolve(
+        urls: typing.Iterable[str], game_version: str, mod_loader: str,
+        on_result: typing.Callable[[Result], None] = None, **kwargs):
+    """
+    Resolves the mod URLs with a Pipeline and returns the results. \n
+    Unless an index is passed, slugs are mapped to projects with the persistent project index. \n
+    """
+
+    kwargs.setdefault('index', project_index.ProjectIndex())
+    return asyncio.run(Pipeline(game_version, mod_loader, on_result, **kwargs).run(urls))
+
+
+def resolve_and_download(
+        urls: typing.Iterable[str], game_version: str, mod_loader: str, pool: downloads.DownloadPool,
+        on_result: typing.Callable[[Result], None] = None, **kwargs):
+    """
+    Resolves the mod URLs and submits every resolved file to the download pool right away, so downloads
+    run while the other mods are still resolving, each side under its own concurrency limits. \n
+    The pool is not joined, so more files can be added afterwards. Returns the results. \n
+    """
+
+    def submit(result: Result):
+        if on_result is not None:
+            on_result(result)
+        if result.ok:
+            pool.submit(result.download())
+
+    return resolve(urls, game_version, mod_loader, on_result=submit, **kwargs)
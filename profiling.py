@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import pstats
+import typing
+import cProfile
+import logging
+import platform
+import functools
+import threading
+import contextlib
+import collections
+import tracemalloc
+
+
+PROFILE_LOCATION = "config/profiling"
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples for the collapsed stacks
+MAX_DEPTH = 128
+TRACEMALLOC_FRAMES = 25
+PEAK_GROWTH = 1.1  # A new peak snapshot is taken when traced memory grows by this factor
+TOP_ALLOCATIONS = 25
+TOP_FUNCTIONS = 40
+
+enabled = False
+location = PROFILE_LOCATION
+
+
+def set_enabled(value: bool, directory: str = None):
+    """
+    Turns profiling of the phases on or off, the profiles are written to directory. \n
+    """
+
+    global enabled, location
+    enabled = value
+    if directory:
+        location = directory
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Sampler(threading.Thread):
+    """
+    Samples the stacks of all other threads at a fixed interval, for flamegraph-compatible collapsed stacks,
+    and keeps a tracemalloc snapshot from close to the peak of traced memory. \n
+    Samples are wall-clock, so time spent waiting on the network shows up as well as CPU time. \n
+    """
+
+    def __init__(self):
+        super().__init__(name="profiling-sampler", daemon=True)
+        self.stacks: typing.Counter[str] = collections.Counter()
+        self.peak_snapshot: typing.Optional[tracemalloc.Snapshot] = None
+        self.peak_snapshots = 0
+        self._peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+            current, _ = tracemalloc.get_traced_memory()
+            if current > self._peak * PEAK_GROWTH:
+                self._peak = current
+                self.peak_snapshot = tracemalloc.take_snapshot()
+                self.peak_snapshots += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _write_report(path: str, profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot):
+    with open(path, 'w') as f:
+        f.write("Functions by cumulative time\n\n")
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+
+        if snapshot is not None:
+            f.write("\nLargest allocation sites at peak memory\n\n")
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+                f.write(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback[0]}\n")
+
+
+@contextlib.contextmanager
+def phase(name: str, labels: dict = None):
+    """
+    Profiles the block if profiling is enabled, and writes for the phase: \n
+    .pstats (cProfile dump, open with snakeviz or pstats), .collapsed (stacks for flamegraph.pl or speedscope),
+    .tracemalloc (snapshot near the memory peak), .txt (top functions and allocation sites) and
+    .json (labels, duration and peak memory, to compare runs). \n
+    """
+
+    if not enabled:
+        yield
+        return
+
+    labels = {
+        'phase': name,
+        'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        **(labels or {})
+    }
+    mods = labels.get('mods')
+    base = os.path.join(
+        location, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}" + (f"-{mods}mods" if mods is not None else "")
+    )
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+
+    sampler = _Sampler()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    sampler.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        sampler.stop()
+        labels['seconds'] = round(time.perf_counter() - start, 3)
+        labels['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        snapshot = sampler.peak_snapshot or tracemalloc.take_snapshot()
+        if not was_tracing:
+            tracemalloc.stop()
+
+        os.makedirs(location, exist_ok=True)
+        profiler.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in sampler.stacks.items())
+        snapshot.dump(base + ".tracemalloc")
+        _write_report(base + ".txt", profiler, snapshot)
+        labels['samples'] = sum(sampler.stacks.values())
+        labels['peak_snapshots'] = sampler.peak_snapshots
+        with open(base + ".json", 'w') as f:
+            json.dump(labels, f, indent=4)
+        logging.info(f"Profiled {name} in {labels['seconds']}s, written to '{base}.*'")
+
+
+def profiled(name: str, labels: typing.Callable[[typing.Any], dict] = None):
+    """
+    Decorator that runs a method without arguments (e.g. a Qt button handler) as a profiling phase. \n
+    labels is called with the instance to label the profile. \n
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self):
+            if not enabled:
+                return method(self)
+            with phase(name, labels(self) if labels is not None else None):
+                return method(self)
+        return wrapper
+    return decorator
@@ -0,0 +1,80 @@
+import os
+import json
+import typing
+import threading
+
+import models
+
+
+INDEX_LOCATION = "config/project-index.json"
+
+
+class ProjectIndex:
+    """
+    Persistent (provider, slug) -> project ID, name and icon URL of every mod that was resolved before. \n
+    Project IDs never change, so indexed mods skip the slug lookup and go straight to listing files.
+    Entries are only checked when they are used: if no file is found for an indexed project, the slug is
+    looked up again and the entry is replaced, e.g. when the slug now belongs to another project. \n
+    A location of None keeps the index in memory only. \n
+    """
+
+    def __init__(self, location: typing.Optional[str] = INDEX_LOCATION):
+        self.location = location
+        self._lock = threading.Lock()
+        self._entries: typing.Dict[str, dict] = {}
+        self._changed = False
+        if location is None:
+            return
+
+        try:
+            with open(location) as f:
+                self._entries = json.load(f)
+        except (OSError, json.decoder.JSONDecodeError):
+            self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _key(provider: str, slug: str):
+        return f"{provider}/{slug.lower()}"
+
+    def get(self, provider: str, slug: str) -> typing.Optional[models.Project]:
+        """
+        Returns the indexed project, without its last change date, or None. \n
+        """
+
+        entry = self._entries.get(self._key(provider, slug))
+        if entry is None:
+            return None
+        return models.Project(provider, entry['id'], entry['slug'], entry['name'], entry['icon_url'], '', None)
+
+    def put(self, slug: str, project: models.Project):
+        """
+        Indexes the project under the slug it was looked up by and under its current slug,
+        so a renamed project is found by both. \n
+        """
+
+        entry = {'id': project.id, 'slug': project.slug, 'name': project.name, 'icon_url': project.icon_url}
+        with self._lock:
+            for key in {self._key(project.provider, slug), self._key(project.provider, project.slug)}:
+                if self._entries.get(key) != entry:
+                    self._entries[key] = entry
+                    self._changed = True
+
+    def forget(self, provider: str, slug: str):
+        with self._lock:
+            if self._entries.pop(self._key(provider, slug), None) is not None:
+                self._changed = True
+
+    def save(self):
+        if self.location is None or not self._changed:
+            return
+
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.location}.tmp", 'w') as f:
+            json.dump(self._entries, f, separators=(',', ':'))
+        os.replace(f"{self.location}.tmp", self.location)
+        self._changed = False
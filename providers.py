@@ -0,0 +1,207 @@
+import typing
+import asyncio
+
+import utils
+import models
+import modrinth
+import curseforge
+
+
+class Provider:
+    """
+    Common interface of the mod sources, so the resolution pipeline does not need to know
+    which site a mod comes from. \n
+    """
+
+    name: str = ''
+    display_name: str = ''
+    batch_size: int = 1
+
+    def supports(self, url: str):
+        return utils.get_provider_from_url(url) == self.name
+
+    def is_available(self):
+        return True
+
+    async def lookup(self, slug: str) -> typing.Optional[models.Project]:
+        raise NotImplementedError
+
+    async def lookup_many(self, slugs: typing.List[str]) -> typing.Dict[str, models.Project]:
+        """
+        Returns a dict of slug -> project for the slugs that were found. \n
+        Providers without a batch endpoint look the slugs up concurrently. \n
+        """
+
+        projects = await asyncio.gather(*(self.lookup(slug) for slug in slugs))
+        return {slug: project for slug, project in zip(slugs, projects) if project is not None}
+
+    async def lookup_ids(self, ids: typing.List[typing.Union[int, str]]) -> typing.Dict[typing.Any, models.Project]:
+        """
+        Returns a dict of project ID -> project, fetched with as few requests as the provider allows. \n
+        """
+
+        raise NotImplementedError
+
+    async def get_latest_file(
+            self, project: models.Project, game_version: str, mod_loader: str) -> typing.Optional[models.Version]:
+        raise NotImplementedError
+
+    async def list_files(self, project: models.Project) -> typing.Optional[typing.List[models.Version]]:
+        """
+        Returns every version of the project, newest first. \n
+        """
+
+        raise NotImplementedError
+
+    def select_file(self, versions: typing.Iterable[models.Version], game_version: str, mod_loader: str):
+        """
+        Returns the latest version in the unfiltered list that matches, or None. \n
+        """
+
+        raise NotImplementedError
+
+    async def match_hashes(self, digests: typing.List[dict]) -> typing.Dict[int, models.Version]:
+        """
+        Returns a dict of index in digests -> version for the files the provider knows. \n
+        digests are dicts as returned by utils.hash_file. \n
+        """
+
+        raise NotImplementedError
+
+    def download_url(self, version: models.Version):
+        return version.file.url
+
+    async def search_by_name(self, name: str) -> typing.Optional[models.Project]:
+        """
+        Returns the project with exactly this name (ignoring case and punctuation), or None. \n
+        """
+
+        raise NotImplementedError
+
+    async def find_counterpart(self, slug: str, name: str = None) -> typing.Optional[models.Project]:
+        """
+        Returns the project on this provider that is the same mod as slug/name on another provider, or None. \n
+        Most mods use the same slug everywhere. A slug match is only trusted if the names match too (when
+        the name is known), otherwise the project is searched by name. \n
+        """
+
+        project = await self.lookup(slug)
+        if project is not None and (name is None or same_name(project.name, name)):
+            return project
+        if name is None:
+            return None
+        return await self.search_by_name(name)
+
+
+def same_name(a: str, b: str):
+    def normalize(name: str):
+        return ''.join(c for c in name.lower() if c.isalnum())
+    return normalize(a) == normalize(b)
+
+
+class ModrinthProvider(Provider):
+    name = 'modrinth'
+    display_name = 'Modrinth'
+    batch_size = 100
+
+    async def lookup(self, slug: str):
+        return await modrinth.get_mod_from_slug_async(mod_slug=slug)
+
+    async def lookup_many(self, slugs: typing.List[str]):
+        if len(slugs) == 1:
+            return await super().lookup_many(slugs)
+
+        projects = await modrinth.get_projects_async(slugs)
+        if projects is None:
+            return {}
+
+        # The projects endpoint accepts slugs and IDs, but only returns the current slug
+        by_slug = {project.slug: project for project in projects}
+        by_id = {project.id: project for project in projects}
+        found = {slug: by_slug.get(slug) or by_id.get(slug) for slug in slugs}
+        missing = [slug for slug, project in found.items() if project is None]
+        if missing:
+            # Old slugs of renamed projects are only resolved by the single project endpoint
+            found.update(await super().lookup_many(missing))
+        return {slug: project for slug, project in found.items() if project is not None}
+
+    async def lookup_ids(self, ids: typing.List[str]):
+        projects = {}
+        for i in range(0, len(ids), self.batch_size):
+            for project in await modrinth.get_projects_async(ids[i:i + self.batch_size]) or []:
+                projects[project.id] = project
+        return projects
+
+    # Files are listed by project ID, the slug of an indexed project can be outdated after a rename
+    async def get_latest_file(self, project: models.Project, game_version: str, mod_loader: str):
+        return await modrinth.get_latest_mod_file_async(
+            mod_slug=project.id,
+            game_version=game_version,
+            mod_loader=None if mod_loader == 'any' else mod_loader
+        )
+
+    async def list_files(self, project: models.Project):
+        return await modrinth.get_mod_versions_async(project.id)
+
+    def select_file(self, versions: typing.Iterable[models.Version], game_version: str, mod_loader: str):
+        return modrinth.select_file(versions, game_version, mod_loader)
+
+    async def search_by_name(self, name: str):
+        page = await modrinth.search_mods_async(limit=5, index='relevance', query=name)
+        hit = next((hit for hit in (page or {}).get('hits', []) if same_name(hit['title'], name)), None)
+        return await self.lookup(hit['slug']) if hit is not None else None
+
+    async def match_hashes(self, digests: typing.List[dict]):
+        versions = await modrinth.get_versions_from_hashes_async([digest['sha1'] for digest in digests]) or {}
+        return {i: versions[digest['sha1']] for i, digest in enumerate(digests) if digest['sha1'] in versions}
+
+
+class CurseForgeProvider(Provider):
+    name = 'curseforge'
+    display_name = 'CurseForge'
+
+    def is_available(self):
+        return curseforge.has_api_access()
+
+    async def lookup(self, slug: str):
+        return await curseforge.get_mod_from_slug_async(slug=slug)
+
+    async def lookup_ids(self, ids: typing.List[int]):
+        return {project.id: project for project in await curseforge.get_mods_async(ids) or []}
+
+    async def get_latest_file(self, project: models.Project, game_version: str, mod_loader: str):
+        return await curseforge.get_latest_mod_file_async(
+            mod_id=project.id,
+            game_version=game_version,
+            mod_loader_type=curseforge.MOD_LOADER_TYPES.get(mod_loader, 0)
+        )
+
+    async def list_files(self, project: models.Project):
+        return await curseforge.get_mod_files_async(project.id)
+
+    def select_file(self, versions: typing.Iterable[models.Version], game_version: str, mod_loader: str):
+        return curseforge.select_file(versions, game_version, mod_loader, filtered=False)
+
+    async def search_by_name(self, name: str):
+        # Sorted by popularity, so a popular mod wins over forks with the same name
+        page = await curseforge.search_mods_async(page_size=5, sort_field=2, search_filter=name)
+        mod = next((mod for mod in (page or {}).get('data', []) if same_name(mod['name'], name)), None)
+        return models.Project.from_curseforge(mod) if mod is not None else None
+
+    async def match_hashes(self, digests: typing.List[dict]):
+        files = await curseforge.get_files_from_fingerprints_async([digest['murmur2'] for digest in digests]) or {}
+        return {i: files[digest['murmur2']] for i, digest in enumerate(digests) if digest['murmur2'] in files}
+
+
+PROVIDERS: typing.Dict[str, Provider] = {
+    'modrinth': ModrinthProvider(),
+    'curseforge': CurseForgeProvider()
+}
+
+
+def get_provider(url: str) -> typing.Optional[Provider]:
+    """
+    Returns the provider for the mod URL, or None if the URL is not supported. \n
+    """
+
+    return PROVIDERS.get(utils.get_provider_from_url(url))
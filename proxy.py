@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import urllib.parse
+import http.server
+import requests
+
+import utils
+import modrinth
+import curseforge
+
+
+CACHE_LOCATION = "config/proxy-cache"
+API_TTL = 10 * 60  # Seconds API responses are served from the cache
+CHUNK_SIZE = 1024 * 1024
+
+# Path prefix on the proxy -> upstream API
+UPSTREAMS = {
+    'modrinth': modrinth.API_BASE,
+    'curseforge': curseforge.API_BASE
+}
+
+# Headers that are forwarded to the upstream API
+FORWARDED_HEADERS = ('accept', 'content-type', 'x-api-key', 'user-agent')
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class ProxyCache:
+    """
+    Disk cache for API responses and downloads. \n
+    Concurrent requests for the same object are collapsed into one upstream request,
+    the other requests wait for it and are served from the cache. \n
+    """
+
+    def __init__(self, location: str = CACHE_LOCATION, api_ttl: float = API_TTL, api_key: str = None):
+        self.location = location
+        self.api_ttl = api_ttl
+        self.api_key = api_key
+        self._flights: dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(location, exist_ok=True)
+
+    def _session(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _paths(self, key: str):
+        base = os.path.join(self.location, key[:2], key)
+        return f"{base}.body", f"{base}.json"
+
+    def lookup(self, key: str, ttl: float = None, allow_errors: bool = False):
+        """
+        Returns the (body path, metadata) of a cached object. \n
+        Returns None if the object is not cached or older than ttl. \n
+        Rate limit and server errors, and any error for objects that are cached forever (no ttl),
+        are only returned when allow_errors is set. \n
+        """
+
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, json.decoder.JSONDecodeError):
+            return None
+
+        if ttl is not None and time.time() - meta['time'] > ttl:
+            return None
+        if not allow_errors and (meta['status'] == 429 or meta['status'] >= 500):
+            return None
+        if not allow_errors and ttl is None and not 200 <= meta['status'] < 300:
+            return None
+        if not os.path.exists(body_path):
+            return None
+        return body_path, meta
+
+    def _store(self, key: str, response: requests.Response):
+        body_path, meta_path = self._paths(key)
+        os.makedirs(os.path.dirname(body_path), exist_ok=True)
+
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+        os.replace(tmp_path, body_path)
+
+        meta = {
+            'status': response.status_code,
+            'content_type': response.headers.get('content-type', 'application/octet-stream'),
+            'etag': response.headers.get('etag'),
+            'time': time.time()
+        }
+        with open(f"{meta_path}.tmp", 'w') as f:
+            json.dump(meta, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def fetch(self, method: str, url: str, headers: dict, body: bytes = None, ttl: float = None):
+        """
+        Returns the (body path, metadata) for the request, from the cache if possible. \n
+        Only one upstream request is made for concurrent identical requests. \n
+        """
+
+        key = hashlib.sha256(f"{method} {url}".encode() + (body or b'')).hexdigest()
+        cached = self.lookup(key, ttl)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return self.lookup(key, allow_errors=True)
+
+        try:
+            if self.api_key and not headers.get('x-api-key') and url.startswith(curseforge.API_BASE):
+                headers = {**headers, 'x-api-key': self.api_key}
+
+            logging.info(f"Proxy fetching '{url}'")
+            with self._session().request(method, url, headers=headers, data=body, stream=True, timeout=30) as response:
+                self._store(key, response)
+            return self.lookup(key, allow_errors=True)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+class ProxyRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Routes: \n
+    /modrinth/<path> -> Modrinth API \n
+    /curseforge/<path> -> CurseForge API \n
+    /download?url=<url> -> mod file on a provider CDN (utils.CDN_HOSTS), cached forever \n
+    """
+
+    cache: ProxyCache = None
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def _handle(self, method: str):
+        parsed = urllib.parse.urlsplit(self.path)
+        body = None
+        if method == 'POST':
+            body = self.rfile.read(int(self.headers.get('content-length', 0)))
+
+        upstream_url, ttl = None, None
+        prefix, _, rest = parsed.path.lstrip('/').partition('/')
+        if prefix in UPSTREAMS:
+            upstream_url = f"{UPSTREAMS[prefix]}/{rest}"
+            if parsed.query:
+                upstream_url = f"{upstream_url}?{parsed.query}"
+            ttl = self.cache.api_ttl
+        elif prefix == 'download':
+            upstream_url = urllib.parse.parse_qs(parsed.query).get('url', [None])[0]
+            if upstream_url is not None and not utils.is_cdn_url(upstream_url):
+                self.send_error(403)
+                return
+
+        if upstream_url is None:
+            self.send_error(404)
+            return
+
+        headers = {name.lower(): value for name, value in self.headers.items() if name.lower() in FORWARDED_HEADERS}
+        try:
+            body_path, meta = self.cache.fetch(method, upstream_url, headers, body, ttl)
+        except requests.RequestException as e:
+            logging.error(f"Proxy could not fetch '{upstream_url}': {e}")
+            self.send_error(502)
+            return
+
+        self.send_response(meta['status'])
+        self.send_header('Content-Type', meta['content_type'])
+        self.send_header('Content-Length', str(os.path.getsize(body_path)))
+        if meta.get('etag'):
+            self.send_header('ETag', meta['etag'])
+        self.end_headers()
+        with open(body_path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(host: str = '127.0.0.1', port: int = 8642, cache: ProxyCache = None):
+    """
+    Runs the caching proxy until interrupted. \n
+    Only local connections are accepted by default, pass the address of a network interface
+    (or 0.0.0.0 for all) to serve other machines. \n
+    Other updaters use it with modrinth.set_api_url, curseforge.set_api_url
+    and utils.set_download_proxy, or the proxy_url setting. \n
+    """
+
+    handler = type('Handler', (ProxyRequestHandler,), {'cache': cache or ProxyCache()})
+    with http.server.ThreadingHTTPServer((host, port), handler) as server:
+        logging.info(f"Serving proxy on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def use_proxy(proxy_url: str):
+    """
+    Points the provider modules and downloads at a proxy started with serve. \n
+    """
+
+    proxy_url = proxy_url.rstrip('/')
+    modrinth.set_api_url(f"{proxy_url}/modrinth/{modrinth.API_VERSION}")
+    curseforge.set_api_url(f"{proxy_url}/curseforge/{curseforge.API_VERSION}")
+    utils.set_download_proxy(proxy_url)
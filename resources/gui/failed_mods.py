@@ -27,13 +27,39 @@ class FailedModsPopup(QDialog):
         # Define widgets
         self._mods_label = self.findChild(QLabel, "modsLabel")
 
+        self._button_box = self.findChild(QDialogButtonBox, "buttonBox")
+        self._retry_button = self._button_box.addButton("Retry failed", QDialogButtonBox.AcceptRole)
+        self._retry_button.clicked.connect(self._retry)
+        self._retry_button.hide()
+        self._retry_pressed = False
+
         self._mods_label.setTextFormat(QtCore.Qt.RichText)
         self._mods_label.setOpenExternalLinks(True)
 
-    def set_mod_urls(self, mod_urls: list):
-        mod_urls = map(lambda url: f'<a href="{url}">{url}</a>', mod_urls)
+    def _retry(self):
+        self._retry_pressed = True
+
+    def set_retry_enabled(self, enabled: bool):
+        self._retry_button.setVisible(enabled)
+
+    def retry_requested(self):
+        return self._retry_pressed
+
+    def set_mod_urls(self, mod_urls: list, suggestions: dict = None, errors: dict = None):
+        if suggestions is None:
+            suggestions = {}
+        if errors is None:
+            errors = {}
+
+        def to_link(url):
+            link = f'<a href="{url}">{url}</a>'
+            if errors.get(url):
+                link += f' ({errors[url]})'
+            if suggestions.get(url):
+                link += f'<br>&nbsp;&nbsp;Did you mean <a href="{suggestions[url]}">{suggestions[url]}</a>?'
+            return link
 
-        self._mods_label.setText("<br>".join(mod_urls))
+        self._mods_label.setText("<br>".join(map(to_link, mod_urls)))
 
 
 if __name__ == '__main__':
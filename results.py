@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import typing
+import logging
+
+import pipeline
+
+
+RESULTS_LOCATION = "config/results.json"
+
+
+class ResultStore:
+    """
+    Results of the last search, kept across runs so failed mods can be retried without resolving the rest. \n
+    entries maps a mod URL to a dict with 'status' ('ok' or a pipeline reason such as 'timeout'), 'error'
+    and, for resolved mods, what is needed to show and download the file. \n
+    """
+
+    def __init__(self, location: typing.Optional[str] = RESULTS_LOCATION):
+        self.location = location
+        self.game_version = ""
+        self.mod_loader = ""
+        self.updated = ""
+        self.entries: typing.Dict[str, dict] = {}
+
+        if location is not None and os.path.exists(location):
+            try:
+                with open(location) as f:
+                    data = json.load(f)
+                self.game_version = data['game_version']
+                self.mod_loader = data['mod_loader']
+                self.updated = data.get('updated', "")
+                self.entries = data['entries']
+            except (OSError, KeyError, json.decoder.JSONDecodeError):
+                logging.warning(f"Could not load results from '{location}'")
+
+    def reset(self, game_version: str, mod_loader: str):
+        """
+        Starts a new result set, e.g. for a full search. \n
+        """
+
+        self.game_version = game_version
+        self.mod_loader = mod_loader
+        self.entries = {}
+
+    def matches(self, game_version: str, mod_loader: str):
+        return self.game_version == game_version and self.mod_loader == mod_loader
+
+    def record(self, result: pipeline.Result):
+        if not result.ok:
+            self.record_failure(result.url, result.reason, result.error)
+            return
+
+        self.entries[result.url] = {
+            'status': 'ok',
+            'error': None,
+            'provider': result.provider.name,
+            'slug': result.slug,
+            'project_id': result.project.id,
+            'name': result.project.name,
+            'logo_url': result.project.icon_url,
+            'file_name': result.file_name,
+            'file_url': result.file_url,
+            'size': result.version.file.size,
+            'sha1': result.version.file.sha1,
+            'dependencies': list(result.version.dependencies)
+        }
+
+    def record_entry(self, url: str, entry: dict):
+        """
+        Records a mod resolved from a snapshot or modpack, entry as made by snapshot.make_entry. \n
+        """
+
+        self.entries[url] = {'status': 'ok', 'error': None, 'size': 0, 'dependencies': [], **entry}
+
+    def record_failure(self, url: str, reason: str, error: str = None):
+        self.entries[url] = {'status': reason, 'error': error}
+
+    def succeeded(self):
+        return {url: entry for url, entry in self.entries.items() if entry['status'] == 'ok'}
+
+    def failed(self, reasons: typing.Iterable[str] = None):
+        """
+        Returns the URLs that failed, only those with one of the reasons if given. \n
+        Unsupported URLs are left out, they can't succeed on a retry. \n
+        """
+
+        return [
+            url for url, entry in self.entries.items()
+            if entry['status'] not in ('ok', pipeline.NOT_SUPPORTED) and (reasons is None or entry['status'] in reasons)
+        ]
+
+    def save(self):
+        if self.location is None:
+            return
+        self.updated = time.strftime("%Y-%m-%d %H:%M:%S")
+        os.makedirs(os.path.dirname(self.location) or ".", exist_ok=True)
+        tmp = self.location + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({
+                'game_version': self.game_version,
+                'mod_loader': self.mod_loader,
+                'updated': self.updated,
+                'entries': self.entries
+            }, f, indent=4)
+        os.replace(tmp, self.location)
+
+
+def retry_failed(
+        store: ResultStore, reasons: typing.Iterable[str] = None,
+        on_result: typing.Callable[[pipeline.Result], None] = None, **kwargs):
+    """
+    Resolves only the failed mods of the store again and merges the outcome into it. \n
+    Returns the pipeline results of the retried mods. \n
+    """
+
+    urls = store.failed(reasons)
+    if not urls:
+        return []
+
+    logging.info(f"Retrying {len(urls)} failed mods for {store.game_version} ({store.mod_loader})")
+
+    def record(result: pipeline.Result):
+        store.record(result)
+        if on_result is not None:
+            on_result(result)
+
+    retried = pipeline.resolve(urls, store.game_version, store.mod_loader, on_result=record, **kwargs)
+    store.save()
+    return retried
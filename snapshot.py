@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import shutil
+import typing
+import asyncio
+import logging
+import zipfile
+import tempfile
+import httpx
+
+import utils
+import models
+import pipeline
+import downloads
+
+
+SNAPSHOT_FORMAT = 1
+INDEX_NAME = 'snapshot.json'
+JAR_DIR = 'jars'
+ICON_DIR = 'icons'
+
+
+class SnapshotError(Exception):
+    """
+    Exception raised when a snapshot can not be read or does not contain a mod.
+
+    Attributes:
+        path -- snapshot file which caused the error
+        message -- explanation of the error
+    """
+
+    def __init__(self, path, message="Snapshot is not valid"):
+        self.path = path
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"'{self.path}' -> {self.message}"
+
+
+def make_entry(slug: str, mod: models.Project, version: models.Version, file: models.File = None):
+    """
+    Returns the compact snapshot entry for a resolved mod and version. \n
+    file selects the file of the version, defaults to the primary file. \n
+    """
+
+    if file is None:
+        file = version.file
+    return {
+        'provider': mod.provider,
+        'slug': slug,
+        'project_id': mod.id,
+        'name': mod.name,
+        'logo_url': mod.icon_url,
+        'file_id': version.id,
+        'file_name': file.file_name,
+        'file_url': file.url,
+        'sha1': file.sha1
+    }
+
+
+async def _fetch(client: httpx.AsyncClient, url: str):
+    try:
+        response = await client.get(utils.proxied_url(url))
+        response.raise_for_status()
+        return response.content
+    except httpx.HTTPError as e:
+        logging.error(f"Could not download '{url}': {e}")
+        return None
+
+
+async def _build(urls: typing.Iterable[str], game_version: str, mod_loader: str):
+    results = await pipeline.Pipeline(game_version, mod_loader).run(urls)
+    failed = [result.url for result in results if not result.ok]
+    entries = [make_entry(result.slug, result.project, result.version) for result in results if result.ok]
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(30), follow_redirects=True) as client:
+        icons = await asyncio.gather(*(
+            _fetch(client, entry['logo_url']) if entry['logo_url'] else asyncio.sleep(0)
+            for entry in entries
+        ))
+
+    return entries, icons, failed
+
+
+def _download_jars(entries: typing.List[dict], directory: str):
+    """
+    Downloads the jars of the entries into directory with the download pool, so only a few are
+    downloaded at a time and none is held in memory. \n
+    Returns the path of every jar, None for jars that could not be downloaded. \n
+    """
+
+    # Names are prefixed with the position, two mods can have jars with the same name
+    jars = [
+        downloads.Download(entry['file_url'], f"{i}-{entry['file_name']}", sha1=entry['sha1'])
+        for i, entry in enumerate(entries)
+    ]
+    failed = downloads.download_all(jars, directory)
+    return [None if jar in failed else os.path.join(directory, jar.file_name) for jar in jars]
+
+
+def _write_snapshot(path: str, game_version: str, mod_loader: str, entries, icons, jars):
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for entry, icon, jar in zip(entries, icons, jars):
+            entry['icon'] = None
+            entry['jar'] = None
+            if icon:
+                entry['icon'] = f"{ICON_DIR}/{entry['provider']}-{entry['slug']}"
+                archive.writestr(entry['icon'], icon)
+            if jar:
+                # Jars are already compressed, storing them keeps extracting at disk speed.
+                # The member keeps the unique name of the downloaded file, see _download_jars
+                entry['jar'] = f"{JAR_DIR}/{os.path.basename(jar)}"
+                archive.write(jar, entry['jar'], compress_type=zipfile.ZIP_STORED)
+
+        index = {
+            'format': SNAPSHOT_FORMAT,
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime()),
+            'game_version': game_version,
+            'mod_loader': mod_loader,
+            'mods': entries
+        }
+        archive.writestr(INDEX_NAME, json.dumps(index, separators=(',', ':')))
+
+
+def export_snapshot(
+        urls: typing.Iterable[str], game_version: str, mod_loader: str,
+        path: str, include_jars: bool = False):
+    """
+    Resolves the mod URLs online and writes a snapshot to path. \n
+    The snapshot contains the metadata needed to resolve and install the mods offline,
+    the icons and optionally the jars. \n
+    Returns the list of URLs that could not be resolved, or with include_jars, whose jar could not be downloaded.
+    Those mods are in the snapshot without their jar. \n
+    """
+
+    entries, icons, failed = asyncio.run(_build(urls, game_version, mod_loader))
+
+    # Next to the output, the jars can be more than fits in a RAM backed temp folder
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as directory:
+        jars = _download_jars(entries, directory) if include_jars else [None] * len(entries)
+        _write_snapshot(f"{path}.tmp", game_version, mod_loader, entries, icons, jars)
+    os.replace(f"{path}.tmp", path)
+
+    if include_jars:
+        failed += [
+            utils.get_mod_url(entry['provider'], entry['slug']) for entry, jar in zip(entries, jars) if jar is None
+        ]
+
+    logging.info(f"Exported {len(entries)} mods to '{path}', {len(failed)} failed")
+    return failed
+
+
+class Snapshot:
+    """
+    Read access to a snapshot written by export_snapshot. \n
+    Resolving and installing mods from it does not need network access. \n
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            self._archive = zipfile.ZipFile(path)
+            index = json.loads(self._archive.read(INDEX_NAME))
+        except (OSError, KeyError, zipfile.BadZipFile, json.decoder.JSONDecodeError):
+            raise SnapshotError(path)
+
+        if index.get('format') != SNAPSHOT_FORMAT:
+            self._archive.close()
+            raise SnapshotError(path, f"Snapshot format {index.get('format')} is not supported")
+
+        self.game_version: str = index['game_version']
+        self.mod_loader: str = index['mod_loader']
+        self.mods: typing.List[dict] = index['mods']
+        self._by_slug = {(entry['provider'], entry['slug']): entry for entry in self.mods}
+        self._by_file_url = {entry['file_url']: entry for entry in self.mods}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._archive.close()
+
+    def get(self, url: str):
+        """
+        Returns the entry for the mod URL. \n
+        Returns None if the mod is not in the snapshot. \n
+        """
+
+        return self._by_slug.get((utils.get_provider_from_url(url), utils.get_slug_from_url(url)))
+
+    def get_by_file_url(self, file_url: str):
+        return self._by_file_url.get(file_url)
+
+    def read_icon(self, entry: dict):
+        if not entry.get('icon'):
+            return None
+        return self._archive.read(entry['icon'])
+
+    def install(self, entry: dict, directory: str):
+        """
+        Extracts the jar of the entry into directory and returns its path. \n
+        Raises SnapshotError if the snapshot was exported without jars. \n
+        """
+
+        if not entry.get('jar'):
+            raise SnapshotError(self.path, f"Snapshot does not contain the jar for '{entry['slug']}'")
+
+        os.makedirs(directory, exist_ok=True)
+        destination = os.path.join(directory, entry['file_name'])
+        with self._archive.open(entry['jar']) as src, open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        return destination
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import logging
+import threading
+import unittest
+import urllib.parse
+import http.server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+import models
+import modrinth
+import pipeline
+import project_index
+
+
+PROJECTS = {
+    'sodium': {'id': 'AAAA', 'slug': 'sodium', 'title': 'Sodium', 'icon_url': None, 'updated': '2'},
+    'lithium': {'id': 'BBBB', 'slug': 'lithium', 'title': 'Lithium', 'icon_url': None, 'updated': '1'}
+}
+VERSIONS = {
+    'sodium': [{
+        'id': 'v1', 'project_id': 'AAAA', 'game_versions': ['1.20.1'], 'loaders': ['fabric'],
+        'date_published': '2', 'dependencies': [],
+        'files': [{'filename': 'sodium.jar', 'url': 'https://cdn.modrinth.com/sodium.jar', 'size': 1,
+                   'hashes': {'sha1': 'aa'}, 'primary': True}]
+    }],
+    'lithium': [{
+        'id': 'v2', 'project_id': 'BBBB', 'game_versions': ['1.19.2'], 'loaders': ['fabric'],
+        'date_published': '1', 'dependencies': [],
+        'files': [{'filename': 'lithium.jar', 'url': 'https://cdn.modrinth.com/lithium.jar', 'size': 1,
+                   'hashes': {'sha1': 'bb'}, 'primary': True}]
+    }]
+}
+
+
+class FakeModrinth(http.server.BaseHTTPRequestHandler):
+    """
+    The parts of the Modrinth API the pipeline uses. \n
+    """
+
+    def _send(self, status: int, data=None):
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        if parts == ['v2', 'projects']:
+            ids = json.loads(urllib.parse.parse_qs(url.query)['ids'][0])
+            self._send(200, [project for slug, project in PROJECTS.items() if slug in ids or project['id'] in ids])
+            return
+
+        if len(parts) >= 3 and parts[:2] == ['v2', 'project']:
+            slug = next((slug for slug, project in PROJECTS.items() if parts[2] in (slug, project['id'])), None)
+            if slug is None:
+                self._send(404)
+            elif parts[3:] == ['version']:
+                self._send(200, VERSIONS[slug])
+            else:
+                self._send(200, PROJECTS[slug])
+            return
+        self._send(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class PipelineTest(unittest.TestCase):
+    """
+    Runs the pipeline end to end over real HTTP connections, so the client configuration in net is used as is. \n
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), FakeModrinth)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_url = modrinth.API_URL
+        modrinth.set_api_url(f"http://127.0.0.1:{cls.server.server_port}/v2")
+
+    @classmethod
+    def tearDownClass(cls):
+        modrinth.set_api_url(cls.api_url)
+        cls.server.shutdown()
+        cls.server.server_close()
+        logging.disable(logging.NOTSET)
+
+    def resolve(self, urls, index=None):
+        return {
+            result.url: result for result in pipeline.resolve(
+                urls, '1.20.1', 'fabric', index=project_index.ProjectIndex(location=None) if index is None else index
+            )
+        }
+
+    def test_resolves_and_classifies(self):
+        results = self.resolve([
+            'https://modrinth.com/mod/sodium',
+            'https://modrinth.com/mod/lithium',
+            'https://modrinth.com/mod/missing',
+            'https://example.com/mod/sodium'
+        ])
+
+        sodium = results['https://modrinth.com/mod/sodium']
+        self.assertTrue(sodium.ok, sodium.error)
+        self.assertEqual(sodium.file_name, 'sodium.jar')
+        self.assertEqual(sodium.project.id, 'AAAA')
+        self.assertEqual(results['https://modrinth.com/mod/lithium'].reason, pipeline.NO_COMPATIBLE_FILE)
+        self.assertEqual(results['https://modrinth.com/mod/missing'].reason, pipeline.NOT_FOUND)
+        self.assertEqual(results['https://example.com/mod/sodium'].reason, pipeline.NOT_SUPPORTED)
+
+    def test_duplicates_are_resolved_once(self):
+        urls = utils.iter_urls(['https://modrinth.com/mod/sodium', 'https://modrinth.com/mod/sodium/'])
+        results = pipeline.resolve(urls, '1.20.1', 'fabric', index=project_index.ProjectIndex(location=None))
+        self.assertEqual(len(results), 1)
+
+    def test_indexed_projects_skip_the_lookup(self):
+        index = project_index.ProjectIndex(location=None)
+        self.resolve(['https://modrinth.com/mod/sodium'], index)
+        self.assertEqual(index.get('modrinth', 'sodium').id, 'AAAA')
+
+        result = self.resolve(['https://modrinth.com/mod/sodium'], index)['https://modrinth.com/mod/sodium']
+        self.assertTrue(result.ok, result.error)
+        self.assertTrue(result.indexed)
+
+    def test_indexed_projects_are_listed_by_id(self):
+        # The project was renamed since it was indexed, its old slug is gone
+        index = project_index.ProjectIndex(location=None)
+        index.put('old-sodium', models.Project('modrinth', 'AAAA', 'old-sodium', 'Sodium', None, '', None))
+
+        result = self.resolve(['https://modrinth.com/mod/old-sodium'], index)['https://modrinth.com/mod/old-sodium']
+        self.assertTrue(result.ok, result.error)
+        self.assertEqual(result.file_name, 'sodium.jar')
+
+    def test_streamed_input(self):
+        lines = iter(["# comment\n", "\n", "https://modrinth.com/mod/sodium\n"])
+        results = pipeline.resolve(
+            utils.iter_urls(lines), '1.20.1', 'fabric', index=project_index.ProjectIndex(location=None)
+        )
+        self.assertEqual([result.ok for result in results], [True])
+
+
+if __name__ == '__main__':
+    unittest.main()
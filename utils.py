@@ -1,12 +1,35 @@
 import os
+import sys
 import json
+import mmap
+import array
+import hashlib
 import pathlib
 import platform
-import sys
+import threading
 import urllib.request
 import urllib.parse
+import concurrent.futures
+import typing
 import requests
 
+try:
+    # Optional, decodes API responses a few times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
+
+download_proxy = None
+# Hosts the mod files of the providers are served from, only these are downloaded through the proxy
+CDN_HOSTS = ('cdn.modrinth.com', 'edge.forgecdn.net', 'mediafilez.forgecdn.net')
+
+HASH_CACHE_LOCATION = "config/hash-cache.json"
+HASH_ALGORITHMS = ('sha1', 'sha512', 'murmur2')
+HASH_CHUNK = 1024 * 1024
+# Bytes CurseForge leaves out of the fingerprint
+FINGERPRINT_WHITESPACE = b'\t\n\r '
+
 
 def clear():
     if platform.system() == "Windows":
@@ -15,11 +38,32 @@ def clear():
         os.system('clear')
 
 
+def set_download_proxy(proxy_url: str = None):
+    """
+    Routes downloads through a caching proxy, None downloads directly. \n
+    """
+
+    global download_proxy
+    download_proxy = proxy_url.rstrip('/') if proxy_url else None
+
+
+def is_cdn_url(url: str):
+    # The whole netloc is compared, so URLs with credentials or a port don't match
+    parsed = urllib.parse.urlsplit(url)
+    return parsed.scheme == 'https' and parsed.netloc.lower() in CDN_HOSTS
+
+
+def proxied_url(url: str):
+    if download_proxy is None or not is_cdn_url(url):
+        return url
+    return f"{download_proxy}/download?url={urllib.parse.quote(url, safe='')}"
+
+
 def download_file_from_url(url: str, directory: str = None, file_name: str = None):
     if file_name is None:
         file_name = get_file_name_from_url(url)
 
-    r = requests.get(url)
+    r = requests.get(proxied_url(url))
 
     if directory is None:
         with open(f"{file_name}", 'wb') as outfile:
@@ -32,13 +76,68 @@ def download_file_from_url(url: str, directory: str = None, file_name: str = Non
             outfile.write(r.content)
 
 
-def get_urls_from_file(file: str):
-    urls = []
+def normalize_url(url: str):
+    """
+    Returns a mod URL in its canonical form, so sub pages, queries and trailing slashes like in
+    'https://modrinth.com/mod/sodium/versions?l=fabric' don't end up in the slug. \n
+    Anything else, e.g. the path of a modpack, is returned stripped. \n
+    """
+
+    url = url.strip()
+    provider = get_provider_from_url(url)
+    if provider is None:
+        return url
+
+    marker = "curseforge.com/minecraft/mc-mods/" if provider == 'curseforge' else "modrinth.com/mod/"
+    slug = url.split(marker, 1)[1].split('#')[0].split('?')[0].split('/')[0]
+    return get_mod_url(provider, slug) if slug else url
+
+
+def iter_urls(lines: typing.Iterable[str]):
+    """
+    Yields the normalized mod URLs in lines, skipping blank lines and comments (lines starting with #). \n
+    Lines are read one at a time, so lists of any length are processed in constant memory. \n
+    """
+
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield normalize_url(line)
+
+
+def read_urls(file: str):
+    """
+    Yields the mod URLs of a file as they are read, '-' reads them from stdin. \n
+    """
+
+    if file == '-':
+        yield from iter_urls(sys.stdin)
+        return
     with open(file) as f:
-        for line in f:
-            if not line == '\n' and not line.startswith('#'):
-                urls.append(line.strip())
-    return urls
+        yield from iter_urls(f)
+
+
+def get_urls_from_file(file: str):
+    return list(read_urls(file))
+
+
+def get_provider_from_url(url: str):
+    """
+    Returns 'curseforge' or 'modrinth' depending on the mod URL. \n
+    Returns None if the URL is not supported. \n
+    """
+
+    if "curseforge.com/minecraft/mc-mods/" in url:
+        return 'curseforge'
+    if "modrinth.com/mod/" in url:
+        return 'modrinth'
+    return None
+
+
+def get_mod_url(provider: str, slug: str):
+    if provider == 'curseforge':
+        return f"https://www.curseforge.com/minecraft/mc-mods/{slug}"
+    return f"https://modrinth.com/mod/{slug}"
 
 
 def get_slug_from_url(url: str):
@@ -50,6 +149,17 @@ def get_file_name_from_url(url: str):
     return urllib.parse.unquote(file_name)
 
 
+def json_loads(data: typing.Union[bytes, str]):
+    """
+    Decodes JSON with orjson if it is installed, otherwise with json. \n
+    Both raise a json.decoder.JSONDecodeError for invalid JSON. \n
+    """
+
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def format_json(json_string: str):
     return json.dumps(json_string, indent=4, sort_keys=True)
 
@@ -63,3 +173,211 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
 
     return os.path.join(base_path, relative_path)
+
+
+class _Murmur2:
+    """
+    32 bit MurmurHash2 fed in chunks. The length is mixed in first, so it has to be known up front. \n
+    """
+
+    M = 0x5bd1e995
+
+    def __init__(self, length: int, seed: int = 1):
+        self.h = (seed ^ length) & 0xFFFFFFFF
+        self.tail = b''
+
+    def update(self, data: bytes):
+        if self.tail:
+            data = self.tail + data
+        end = len(data) - len(data) % 4
+        words = array.array('I', data[:end])
+        if sys.byteorder == 'big':
+            words.byteswap()
+
+        m, h = self.M, self.h
+        for k in words:
+            k = (k * m) & 0xFFFFFFFF
+            k ^= k >> 24
+            k = (k * m) & 0xFFFFFFFF
+            h = ((h * m) & 0xFFFFFFFF) ^ k
+        self.h = h
+        self.tail = data[end:]
+
+    def digest(self):
+        m, h, tail = self.M, self.h, self.tail
+        if len(tail) == 3:
+            h ^= tail[2] << 16
+        if len(tail) >= 2:
+            h ^= tail[1] << 8
+        if len(tail) >= 1:
+            h ^= tail[0]
+            h = (h * m) & 0xFFFFFFFF
+
+        h ^= h >> 13
+        h = (h * m) & 0xFFFFFFFF
+        h ^= h >> 15
+        return h
+
+
+def murmur2(data: bytes, seed: int = 1):
+    """
+    32 bit MurmurHash2, as used by CurseForge for file fingerprints. \n
+    """
+
+    hasher = _Murmur2(len(data), seed)
+    hasher.update(data)
+    return hasher.digest()
+
+
+def curseforge_fingerprint(data: bytes):
+    """
+    Returns the CurseForge fingerprint, murmur2 of the data without whitespace characters. \n
+    """
+
+    return murmur2(data.translate(None, FINGERPRINT_WHITESPACE))
+
+
+def _chunks(data, size: int):
+    for start in range(0, size, HASH_CHUNK):
+        yield data[start:start + HASH_CHUNK]
+
+
+def hash_file(path: str, algorithms: typing.Iterable[str] = HASH_ALGORITHMS):
+    """
+    Returns a dict with a digest for every algorithm, computed in one pass over the file. \n
+    Algorithms can be any hashlib algorithm and 'murmur2' for the CurseForge fingerprint. \n
+    """
+
+    algorithms = tuple(algorithms)
+    hashers = {name: hashlib.new(name) for name in algorithms if name != 'murmur2'}
+    fingerprint = None
+
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            data = b''
+        else:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if 'murmur2' in algorithms:
+                # The fingerprint starts from its length, so the whitespace is counted first,
+                # which is cheap next to hashing
+                length = size
+                for chunk in _chunks(data, size):
+                    length -= len(chunk) - len(chunk.translate(None, FINGERPRINT_WHITESPACE))
+                fingerprint = _Murmur2(length)
+
+            for chunk in _chunks(data, size):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+                if fingerprint is not None:
+                    fingerprint.update(chunk.translate(None, FINGERPRINT_WHITESPACE))
+        finally:
+            if size != 0:
+                data.close()
+
+    digests = {name: hasher.hexdigest() for name, hasher in hashers.items()}
+    if fingerprint is not None:
+        digests['murmur2'] = fingerprint.digest()
+    return digests
+
+
+class HashCache:
+    """
+    Persistent digests keyed by (path, size, mtime), unchanged files are never hashed twice. \n
+    A location of None keeps the digests in memory only. \n
+    """
+
+    def __init__(self, location: typing.Optional[str] = HASH_CACHE_LOCATION):
+        self.location = location
+        self._lock = threading.Lock()
+        self._entries = {}
+        if location is None:
+            return
+
+        try:
+            with open(location) as f:
+                self._entries: dict = json.load(f)
+        except (OSError, json.decoder.JSONDecodeError):
+            self._entries = {}
+
+    def get(self, path: str, stat: os.stat_result, algorithms: typing.Iterable[str]):
+        entry = self._entries.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+            return None
+        if not all(name in entry['hashes'] for name in algorithms):
+            return None
+        return entry['hashes']
+
+    def put(self, path: str, stat: os.stat_result, hashes: dict):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                hashes = {**entry['hashes'], **hashes}
+            self._entries[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hashes': hashes}
+
+    def save(self):
+        if self.location is None:
+            return
+
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Forget files that no longer exist
+        entries = {path: entry for path, entry in self._entries.items() if os.path.exists(path)}
+        with open(f"{self.location}.tmp", 'w') as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.replace(f"{self.location}.tmp", self.location)
+
+
+def hash_files(
+        paths: typing.Iterable[str], algorithms: typing.Iterable[str] = HASH_ALGORITHMS,
+        cache: HashCache = None, workers: int = None):
+    """
+    Returns a dict of absolute path -> digests for all files. \n
+    Cached digests are used for unchanged files, the rest is hashed in parallel,
+    in processes when murmur2 is needed (pure Python) and threads otherwise (hashlib releases the GIL). \n
+    """
+
+    algorithms = tuple(algorithms)
+    if cache is None:
+        cache = HashCache()
+
+    results = {}
+    todo = []
+    for path in paths:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        hashes = cache.get(path, stat, algorithms)
+        if hashes is not None:
+            results[path] = {name: hashes[name] for name in algorithms}
+        else:
+            todo.append((path, stat))
+
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        if 'murmur2' in algorithms and len(todo) > 1:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(todo)))
+        else:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(todo)))
+
+        with executor:
+            futures = {executor.submit(hash_file, path, algorithms): (path, stat) for path, stat in todo}
+            for future in concurrent.futures.as_completed(futures):
+                path, stat = futures[future]
+                results[path] = future.result()
+                cache.put(path, stat, results[path])
+        cache.save()
+
+    return results
+
+
+def hash_folder(folder: str, algorithms: typing.Iterable[str] = HASH_ALGORITHMS, cache: HashCache = None):
+    """
+    Returns the digests of all jars in the folder, see hash_files. \n
+    """
+
+    paths = [entry.path for entry in os.scandir(folder) if entry.is_file() and entry.name.endswith(".jar")]
+    return hash_files(paths, algorithms, cache)
@@ -0,0 +1,270 @@
+import os
+import json
+import time
+import random
+import typing
+import asyncio
+import logging
+import collections
+
+import net
+import utils
+import install
+import downloads
+import pipeline
+import providers
+
+
+PROFILES_LOCATION = "config/profiles.json"
+STATE_LOCATION = "config/watch-state.json"
+FEED_LOCATION = "config/watch-feed.jsonl"
+DEFAULT_INTERVAL = 3600  # Seconds between polls of a profile
+JITTER = 0.1  # Polls are spread by up to this fraction of the interval, so they don't all hit the API at once
+
+
+def load_profiles(location: str = PROFILES_LOCATION) -> typing.Dict[str, dict]:
+    """
+    Returns the saved profiles, name -> profile. \n
+    A profile has the keys urls_file, game_version, mod_loader and optionally mods_folder, interval and auto_stage. \n
+    """
+
+    if not os.path.exists(location):
+        return {}
+    with open(location) as f:
+        return json.load(f)
+
+
+def _write_json(location: str, data):
+    os.makedirs(os.path.dirname(location) or ".", exist_ok=True)
+    tmp = location + ".tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp, location)
+
+
+def save_profile(name: str, profile: dict, location: str = PROFILES_LOCATION):
+    profiles = load_profiles(location)
+    profiles[name] = profile
+    _write_json(location, profiles)
+
+
+def remove_profile(name: str, location: str = PROFILES_LOCATION):
+    """
+    Returns False if there was no profile with that name. \n
+    """
+
+    profiles = load_profiles(location)
+    if profiles.pop(name, None) is None:
+        return False
+    _write_json(location, profiles)
+    return True
+
+
+class Watcher:
+    """
+    Polls the mods of saved profiles and writes a line to the change feed for every mod
+    that got a new compatible file. \n
+    A poll costs one batched project request per provider (per 100 mods on Modrinth), made conditional
+    where the API sends validators. Files are only fetched for projects whose last change date moved. \n
+    """
+
+    def __init__(
+            self, profiles: typing.Dict[str, dict], state_location: str = STATE_LOCATION,
+            feed_location: str = FEED_LOCATION):
+        self.profiles = profiles
+        self.state_location = state_location
+        self.feed_location = feed_location
+        self.validators = net.ValidatorCache()
+
+        # profile -> mod URL -> what was seen in the last poll
+        self.state: typing.Dict[str, typing.Dict[str, dict]] = {}
+        if os.path.exists(state_location):
+            with open(state_location) as f:
+                self.state = json.load(f)
+
+    def _emit(self, event: dict):
+        event = {'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'), **event}
+        line = json.dumps(event)
+        if self.feed_location == '-':
+            print(line, flush=True)
+            return
+        with open(self.feed_location, 'a') as f:
+            f.write(line + "\n")
+
+    async def _resolve_new(self, name: str, profile: dict, urls: typing.List[str]):
+        """
+        Resolves mods that are not in the state yet (new in the list or failed before) with the pipeline. \n
+        """
+
+        mods = self.state[name]
+        pipe = pipeline.Pipeline(profile['game_version'], profile['mod_loader'])
+        for result in await pipe.run(urls):
+            if not result.ok:
+                continue
+            mods[result.url] = {
+                'provider': result.provider.name,
+                'project_id': result.project.id,
+                'name': result.project.name,
+                'updated': result.project.updated,
+                'version_id': result.version.id,
+                'file_name': result.file_name,
+                'file_url': result.file_url,
+                'sha1': result.version.file.sha1
+            }
+
+    async def _check(self, name: str, profile: dict, urls: typing.List[str]):
+        """
+        Returns the mod URLs whose file changed since the last poll, and updates the state. \n
+        """
+
+        mods = self.state[name]
+        by_provider = collections.defaultdict(list)
+        for url in urls:
+            by_provider[mods[url]['provider']].append(url)
+
+        async def check_provider(provider: providers.Provider, provider_urls: typing.List[str]):
+            # Same IDs in the same order every poll, so the request URL and its validators stay the same
+            ids = list(dict.fromkeys(mods[url]['project_id'] for url in provider_urls))
+            projects = await provider.lookup_ids(ids)
+            changed = []
+            for url in provider_urls:
+                project = projects.get(mods[url]['project_id'])
+                if project is None or project.updated == mods[url]['updated']:
+                    continue
+
+                version = await provider.get_latest_file(project, profile['game_version'], profile['mod_loader'])
+                if version is None or provider.download_url(version) is None:
+                    continue
+                mod = mods[url]
+                mod['updated'] = project.updated
+                if version.id == mod['version_id']:
+                    continue
+
+                self._emit({
+                    'event': 'update', 'profile': name, 'url': url, 'name': project.name,
+                    'provider': provider.name, 'old_file': mod['file_name'], 'new_file': version.file.file_name,
+                    'file_url': provider.download_url(version), 'sha1': version.file.sha1
+                })
+                mod.update({
+                    'version_id': version.id,
+                    'file_name': version.file.file_name,
+                    'file_url': provider.download_url(version),
+                    'sha1': version.file.sha1
+                })
+                changed.append(url)
+            return changed
+
+        results = await asyncio.gather(*(
+            check_provider(providers.PROVIDERS[provider_name], provider_urls)
+            for provider_name, provider_urls in by_provider.items()
+            if providers.PROVIDERS[provider_name].is_available()
+        ))
+        return [url for changed in results for url in changed]
+
+    def _stage(self, name: str, profile: dict, urls: typing.List[str], tracked_files: typing.Set[str]):
+        """
+        Installs the complete updated set of mods with a staged install, unchanged jars are linked, not downloaded. \n
+        Jars in the mods folder that are not in tracked_files (the files of the mods before the poll) were added
+        by hand and are kept. Nothing is staged if any listed mod is not resolved, that would remove it. \n
+        """
+
+        mods = self.state[name]
+        unresolved = [url for url in urls if url not in mods]
+        if unresolved:
+            error = f"{len(unresolved)} mods are not resolved, e.g. '{unresolved[0]}'"
+            logging.error(f"Not staging updates of '{name}', {error}")
+            self._emit({'event': 'stage_failed', 'profile': name, 'error': error})
+            return
+
+        staged = None
+        try:
+            staged = install.StagedInstall(profile['mods_folder'])
+            missing = []
+            for url in urls:
+                mod = mods[url]
+                if staged.reuse(mod['file_name'], mod['sha1']) is None:
+                    missing.append(downloads.Download(mod['file_url'], mod['file_name'], sha1=mod['sha1']))
+            if os.path.isdir(staged.mods_folder):
+                for file_name in os.listdir(staged.mods_folder):
+                    if file_name.endswith('.jar') and file_name not in tracked_files:
+                        staged.reuse(file_name)
+            staged.download_all(missing)
+            staged.commit()
+        except (install.InstallError, OSError) as e:
+            if staged is not None:
+                staged.abort()
+            logging.error(f"Couldn't stage updates of '{name}' ({e})")
+            self._emit({'event': 'stage_failed', 'profile': name, 'error': str(e)})
+            return
+        self._emit({'event': 'staged', 'profile': name, 'mods_folder': staged.mods_folder})
+
+    async def poll(self, name: str):
+        """
+        Polls one profile and returns the URLs of the mods that got a new file. \n
+        """
+
+        profile = self.profiles[name]
+        urls = utils.get_urls_from_file(profile['urls_file'])
+        mods = self.state.setdefault(name, {})
+        # Files of all mods the watcher installed, jars besides these in the mods folder were added by hand
+        tracked_files = {mod['file_name'] for mod in mods.values()}
+
+        # Forget mods that were removed from the list, so the state doesn't grow over time
+        for url in set(mods) - set(urls):
+            del mods[url]
+
+        async with net.session():
+            with net.conditional(self.validators):
+                known = [url for url in urls if url in mods]
+                changed = await self._check(name, profile, known)
+
+                new = [url for url in urls if url not in mods]
+                if new:
+                    await self._resolve_new(name, profile, new)
+
+        _write_json(self.state_location, self.state)
+        logging.info(f"Polled '{name}': {len(changed)} updates, {len(urls) - len(mods)} mods not resolved, "
+                     f"{self.validators.not_modified} requests not modified so far")
+
+        if changed and profile.get('auto_stage') and profile.get('mods_folder'):
+            await asyncio.to_thread(self._stage, name, profile, urls, tracked_files)
+        return changed
+
+    async def _watch_profile(self, name: str, once: bool):
+        interval = self.profiles[name].get('interval', DEFAULT_INTERVAL)
+        if not once:
+            await asyncio.sleep(random.uniform(0, interval * JITTER))
+
+        while True:
+            try:
+                await self.poll(name)
+            except Exception as e:
+                logging.exception(e)
+                self._emit({'event': 'poll_failed', 'profile': name, 'error': str(e)})
+            if once:
+                return
+            await asyncio.sleep(interval * random.uniform(1 - JITTER, 1 + JITTER))
+
+    async def run(self, once: bool = False):
+        """
+        Polls every profile on its own schedule until cancelled, or one time if once is True. \n
+        """
+
+        await asyncio.gather(*(self._watch_profile(name, once) for name in self.profiles))
+
+
+def watch(
+        names: typing.List[str] = None, once: bool = False, profiles_location: str = PROFILES_LOCATION,
+        state_location: str = STATE_LOCATION, feed_location: str = FEED_LOCATION):
+    """
+    Watches the named profiles, or all saved profiles, see Watcher. \n
+    """
+
+    profiles = load_profiles(profiles_location)
+    if names:
+        missing = [name for name in names if name not in profiles]
+        if missing:
+            raise KeyError(f"Unknown profiles: {', '.join(missing)}")
+        profiles = {name: profiles[name] for name in names}
+
+    asyncio.run(Watcher(profiles, state_location, feed_location).run(once))